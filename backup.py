@@ -2,11 +2,15 @@
 
 import sys
 import os
+import concurrent.futures
+import itertools
 import shutil
-import subprocess
 import datetime
 import socket
 import pathlib
+import re
+import shlex
+import tempfile
 import getpass
 import toolz
 
@@ -24,12 +28,32 @@ error = f"{ce}E{c0}:"
 done = f"{cok}OK{c0}:"
 warning = f"{cw}W{c0}:"
 
+default_jobs = 4
+
+rsync_opt = ["-qOatzulr", "--delete", "--exclude=*~"]
+
+# Monthly (yymm) backups and daily (yymmdd) snapshots of a host
+backup_re = re.compile(r"^(\d{4}|\d{6})_(.+)$")
+
 
 def usage(err_code=0):
     my_script = os.path.basename(__file__)
     print(f"{ci}{__description__}\nUsage{c0}:")
     print(f"  {my_script} [OPTION] [DESTINATION_FOLDER]")
     print(f"{ci}Options{c0}:")
+    print(f"  -j,--jobs <N>: Back up N disks at a time (default: {default_jobs})")
+    print(f"  -s,--snapshot: Daily snapshot, unchanged files being hard links")
+    print(f"                 to the previous backup")
+    print(f"  --keep-daily <N>: Keep only the N last daily snapshots")
+    print(f"  --keep-monthly <N>: Keep only the last backup of the N last months")
+    print(f"  --store: Back up in a deduplicating chunk store ('DESTINATION/store'),")
+    print(f"           chunking files with N processes (default: CPU count)")
+    print(f"  --restore <SNAPSHOT>: Restore a store snapshot in './SNAPSHOT'")
+    print(f"  -a,--archive: Back up as a tar.xz archive compressed by blocks with")
+    print(f"                N processes (default: CPU count), along with an")
+    print(f"                index of its members")
+    print(f"  --gzip: Compress archive as tar.gz, faster but bigger")
+    print(f"  --extract <PATH>: Extract PATH from archive DESTINATION in current folder")
     print(f"  -h,--help: Print this help\n")
     exit(err_code)
 
@@ -44,6 +68,10 @@ def test_backupfolder(folder):
         print(f"{error} Invalid folder '{folder}'\n")
         return False
 
+    # Remote folders are created by rsync
+    if is_remote(folder):
+        return True
+
     okcreate=""
 
     if not os.path.exists(folder):
@@ -62,26 +90,285 @@ def test_backupfolder(folder):
     return True
 
 
-def rsync_bkp(bkp_src, bkp_folder):
-    err_cpt = 0
+def is_remote(folder):
+    """
+    Tell if {folder} is a remote rsync destination ('[user@]host:path')
+    """
+
+    return ":" in folder.split("/", 1)[0]
+
+
+def split_remote(folder):
+    """
+    Return (host, path) of a destination, host being None if local
+    """
+
+    if is_remote(folder):
+        host, path = folder.split(":", 1)
+        return host, path
+
+    return None, folder
+
+
+def ssh_master(dst_folder):
+    """
+    Open a shared SSH connection to the host of a remote destination
+    Return the ssh command going through it
+    """
+
+    host, _ = split_remote(dst_folder)
+    control = f"{tempfile.gettempdir()}/toolz-backup-{os.getpid()}-%C"
+    ssh_cmd = ["ssh", "-o", "ControlMaster=auto", "-o",
+            f"ControlPath={control}", "-o", "ControlPersist=60"]
+
+    toolz.run.run([*ssh_cmd, "-fN", host])
+
+    return ssh_cmd
+
+
+def ssh_master_exit(dst_folder, ssh_cmd):
+    """
+    Close the shared SSH connection opened by ssh_master()
+    """
+
+    host, _ = split_remote(dst_folder)
+
+    toolz.run.run([*ssh_cmd, "-O", "exit", host], capture=True,
+            quiet_errors=True)
+
+
+def rsync_options(ssh_cmd=None, link_dest=None):
+    """
+    Return rsync options, to go through {ssh_cmd} and hard link files
+    unchanged since {link_dest} folder, with statistics to count them
+    """
+
+    opts = rsync_opt.copy()
+
+    if ssh_cmd:
+        opts += ["-e", shlex.join(ssh_cmd)]
+
+    if link_dest:
+        # Statistics are asked for to report space saved by snapshots
+        opts += [f"--link-dest={link_dest}", "--info=stats2"]
+
+    return opts
+
+
+def count_stats(result, stats):
+    """
+    Add total and transferred file sizes of an rsync run to {stats}
+    """
+
+    for line in result.stdout.splitlines():
+        for key, label in [("total", "Total file size:"),
+                ("transferred", "Total transferred file size:")]:
+            if line.startswith(label):
+                size = line[len(label):].split()[0].replace(",", "")
+                toolz.file.count(stats, key, int(size))
+
+
+def rsync_files_from(bkp_srcs, bkp_folder, ssh_cmd, link_dest=None,
+        stats=None):
+    """
+    Back up several elements in a single rsync session, by a '--files-from'
+    list, through the shared SSH connection
+    Return [(element, rsync status, error messages)], rsync errors being
+    given to the elements they mention, or to all of them if none is
+    """
+
+    with tempfile.NamedTemporaryFile("w", prefix="toolz-backup-") as files_from:
+        files_from.write("".join(f"{bkp_src}\n" for bkp_src in bkp_srcs))
+        files_from.flush()
+
+        result = toolz.run.run(["rsync", *rsync_options(ssh_cmd, link_dest),
+            f"--files-from={files_from.name}", "/", f"{bkp_folder}/"],
+            capture=True)
+
+    count_stats(result, stats)
+
+    if result.status == 0:
+        return [(bkp_src, 0, "") for bkp_src in bkp_srcs]
+
+    messages = {bkp_src: [] for bkp_src in bkp_srcs}
+    general = []
+
+    for line in result.stderr.splitlines():
+        owners = [bkp_src for bkp_src in bkp_srcs if f"\"{bkp_src}" in line or
+                f"\"{bkp_src.lstrip('/')}" in line]
+
+        if owners:
+            messages[max(owners, key=len)].append(line)
+        else:
+            general.append(line)
+
+    if not any(messages.values()):
+        return [(bkp_src, result.status, "\n".join(general)) for
+                bkp_src in bkp_srcs]
+
+    return [(bkp_src, result.status if messages[bkp_src] else 0,
+        "\n".join(messages[bkp_src])) for bkp_src in bkp_srcs]
+
+
+def rsync_bkp(bkp_src, bkp_folder, link_dest=None, stats=None):
     bkp_subfolder = os.path.dirname(bkp_src)
-    rsync_opt = "-qOatzulr --delete --exclude='*~'"
 
-    if not os.path.exists(f"{bkp_folder}{bkp_subfolder}"):
-        os.makedirs(f"{bkp_folder}{bkp_subfolder}")
+    os.makedirs(f"{bkp_folder}{bkp_subfolder}", exist_ok=True)
 
     bkp_dst = f"{bkp_folder}/{bkp_subfolder}"
-    bkp_cmd = f"rsync {rsync_opt} {bkp_src} {bkp_dst}"
 
-    if os.system(bkp_cmd) != 0:
-        err_cpt += 1
+    if link_dest:
+        link_dest = f"{link_dest}{bkp_subfolder}"
+
+    result = toolz.run.run(["rsync", *rsync_options(link_dest=link_dest),
+        bkp_src, bkp_dst], capture=True)
+    count_stats(result, stats)
+
+    return result
+
+
+def device(path):
+    """
+    Return device holding {path}, None if unknown
+    """
+
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return None
+
+
+def backup_elements(elements, bkp_folder, jobs, ssh_cmd=None, link_dest=None,
+        stats=None):
+    """
+    Back up elements with {jobs} workers, each one going through the
+    elements of a single device, so that a disk is never read in parallel
+    With {ssh_cmd}, for remote destinations, elements of a device are
+    backed up in a single rsync session
+    Yield (element, rsync status, error messages) in the order of {elements}
+    """
+
+    devices = {element: device(element) for element in elements}
+    by_device = {}
+
+    for element in elements:
+        by_device.setdefault(devices[element], []).append(element)
+
+    def backup_device(device_elements):
+        """
+        Return {element: (rsync status, error messages)} of a device
+        """
+
+        if ssh_cmd is not None:
+            return {element: (status, errors) for element, status, errors in
+                    rsync_files_from(device_elements, bkp_folder, ssh_cmd,
+                        link_dest, stats)}
+
+        results = {}
+
+        for element in device_elements:
+            try:
+                result = rsync_bkp(element, bkp_folder, link_dest, stats)
+                results[element] = (result.status, result.stderr.strip())
+            except OSError as exc:
+                results[element] = (1, exc.strerror)
+
+        return results
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {dev: pool.submit(backup_device, device_elements) for
+                dev, device_elements in by_device.items()}
+
+        for element in elements:
+            # Elements a worker failed on or gave no result for count as failed
+            try:
+                results = futures[devices[element]].result()
+                failure = (1, "No rsync result")
+            except Exception as exc:
+                results = {}
+                failure = (1, f"{type(exc).__name__}: {exc}")
+
+            yield (element, *results.get(element, failure))
+
+
+def list_backups(dst_folder, ssh_cmd=None):
+    """
+    List backup folders of this host in a destination, oldest first
+    """
+
+    host, path = split_remote(dst_folder)
+
+    if host:
+        names = toolz.run.output([*ssh_cmd, host,
+            f"ls -1 -- {shlex.quote(path)}"]).split()
+    else:
+        names = os.listdir(path)
+
+    backups = []
+
+    for name in names:
+        match = backup_re.match(name)
+
+        if match and match.group(2) == my_hostname:
+            backups.append(name)
+
+    # Monthly folders (yymm) sort as the start of their month
+    return sorted(backups, key=lambda name: name.split("_")[0].ljust(6, "0"))
+
+
+def expired_backups(backups, keep_daily=None, keep_monthly=None):
+    """
+    Return backups out of retention: the last {keep_daily} daily snapshots
+    and the last backup of each of the last {keep_monthly} months are kept
+    (None keeping all of them)
+    """
+
+    kept = set(backups[-1:])
+    dailies = [name for name in backups if len(name.split("_")[0]) == 6]
+    last_of_month = {}
+
+    for name in backups:
+        last_of_month[name[:4]] = name
+
+    if keep_daily is None:
+        kept.update(dailies)
+    elif keep_daily > 0:
+        kept.update(dailies[-keep_daily:])
+
+    months = sorted(last_of_month)
+
+    if keep_monthly is None:
+        kept.update(last_of_month.values())
+    elif keep_monthly > 0:
+        kept.update(last_of_month[month] for month in months[-keep_monthly:])
 
-    return err_cpt
+    return [name for name in backups if name not in kept]
 
 
-def backup_to(dst_folder):
-    today = datetime.datetime.today().strftime("%y%m")
-    bkp_folder = f"{dst_folder}/{today}_{my_hostname}"
+def remove_backup(dst_folder, name, ssh_cmd=None):
+    """
+    Remove a backup folder, return True on success
+    """
+
+    host, path = split_remote(dst_folder)
+
+    if host:
+        # Remote shell splits and expands the command line
+        return toolz.run.status([*ssh_cmd, host,
+            f"rm -rf -- {shlex.quote(f'{path}/{name}')}"])
+
+    try:
+        shutil.rmtree(f"{path}/{name}")
+    except OSError:
+        return False
+
+    return True
+
+
+def backup_sources():
+    """
+    Return existing home elements, config files and other elements to back up
+    """
 
     home_backups = [".profile", ".face", ".kodi", ".mozilla", ".vim", ".steam",
             ".config", ".local", "Documents", "Music", "Pictures", "Videos",
@@ -98,73 +385,326 @@ def backup_to(dst_folder):
     if socket.gethostname() == "mrchat":
         more_backups = ["/volumes/speedix/Music", "/volumes/speedix/Games"]
 
-    if not os.path.exists(bkp_folder):
+    home_srcs = [f"{my_home}/{bkp_element}" for bkp_element in home_backups]
+
+    return [[bkp_src for bkp_src in srcs if os.path.exists(bkp_src)] for srcs in
+            [home_srcs, cfg_files, more_backups]]
+
+
+def backup_to(dst_folder, jobs=default_jobs, snapshot=False, keep_daily=None,
+        keep_monthly=None):
+    if snapshot:
+        today = datetime.datetime.today().strftime("%y%m%d")
+    else:
+        today = datetime.datetime.today().strftime("%y%m")
+
+    bkp_name = f"{today}_{my_hostname}"
+    bkp_folder = f"{dst_folder}/{bkp_name}"
+    remote = is_remote(dst_folder)
+
+    if not remote and not os.path.exists(bkp_folder):
         os.makedirs(bkp_folder)
 
-    my_user = getpass.getuser()
-    my_home = pathlib.Path.home()
+    home_srcs, cfg_srcs, more_srcs = backup_sources()
+
+    sections = [
+            (f"{my_user}'s home backuped in '{bkp_folder}{my_home}'",
+                home_srcs),
+            (f"Config files backuped in '{bkp_folder}'", cfg_srcs)
+            ]
+
+    for bkp_src in more_srcs:
+        sections.append((f"'{bkp_src}' backuped in '{bkp_folder}'", [bkp_src]))
+
+    ssh_cmd = ssh_master(dst_folder) if remote else None
+    link_dest = None
+    stats = {}
+
+    if snapshot:
+        previous = [name for name in list_backups(dst_folder, ssh_cmd) if
+                name != bkp_name]
+
+        if previous:
+            host, path = split_remote(dst_folder)
+
+            # rsync takes a relative --link-dest from the destination folder
+            if not host:
+                path = os.path.abspath(path)
+
+            link_dest = f"{path}/{previous[-1]}"
+            print(f"{ci}Unchanged files hard linked from{c0}: '{previous[-1]}'")
+
+    results = backup_elements([e for _, section in sections for e in section],
+            bkp_folder, jobs, ssh_cmd, link_dest, stats)
+    err_total = 0
+
+    for msg, section in sections:
+        err_cpt = 0
+
+        for bkp_src, status, errors in itertools.islice(results, len(section)):
+            if status != 0:
+                err_cpt += 1
+                print(f"{warning} '{bkp_src}' failed ({status}): {errors}")
+
+        if err_cpt == 0:
+            ecol = "\33[32m"
+        else:
+            ecol = "\33[31m"
+
+        err_total += err_cpt
+        print(f"{done} {msg} with {ecol}{err_cpt}{c0} error(s)")
+
+    if link_dest:
+        saved = stats.get("total", 0) - stats.get("transferred", 0)
+        print(f"{done} {toolz.file.human_size(saved)} of", end=" ")
+        print(f"{toolz.file.human_size(stats.get('total', 0))} not transferred,",
+                end=" ")
+        print("hard linked to previous snapshot or already there")
+
+    if snapshot and (keep_daily is not None or keep_monthly is not None):
+        if err_total:
+            print(f"{warning} Errors occurred, old snapshots kept")
+        else:
+            for name in expired_backups(list_backups(dst_folder, ssh_cmd),
+                    keep_daily, keep_monthly):
+                if name == bkp_name:
+                    continue
+
+                if remove_backup(dst_folder, name, ssh_cmd):
+                    print(f"{done} Expired snapshot '{name}' removed")
+                else:
+                    print(f"{error} Failed to remove snapshot '{name}'")
+
+    if remote:
+        ssh_master_exit(dst_folder, ssh_cmd)
+
+    print()
+
 
-    err_home = 0
+def backup_to_store(dst_folder, jobs=None):
+    store_folder = f"{dst_folder}/store"
+    today = datetime.datetime.today().strftime("%y%m%d")
+    bkp_name = f"{today}_{my_hostname}"
+    bkp_srcs = [bkp_src for srcs in backup_sources() for bkp_src in srcs]
 
-    for bkp_element in home_backups:
-        bkp_src = f"{my_home}/{bkp_element}"
+    # Only snapshots of this host are worth comparing files with
+    previous = [name for name in toolz.store.snapshots(store_folder) if
+            name.endswith(f"_{my_hostname}")]
 
-        if os.path.exists(bkp_src):
-            err_home += rsync_bkp(bkp_src, bkp_folder)
+    report = {}
+    progress = toolz.file.Progress(toolz.file.print_progress)
+    errors = toolz.store.backup(store_folder, bkp_name, bkp_srcs, jobs, report,
+            previous[-1] if previous else None, progress)
+    progress.finish()
 
-    if err_home == 0:
+    for path, message in errors.items():
+        print(f"{warning} '{path}' failed: {message}")
+
+    if not errors:
         ecol = "\33[32m"
     else:
         ecol = "\33[31m"
 
-    home_bkp_ret = f"{done} {my_user}'s home backuped in '{bkp_folder}"
-    home_bkp_ret += f"{my_home}' with {ecol}{err_home}{c0} error(s)"
-    
-    print(home_bkp_ret)
+    print(f"{done} {toolz.file.human_size(report.get('bytes', 0))} backuped",
+            end=" ")
+    print(f"in snapshot '{bkp_name}' of '{store_folder}'", end=" ")
+    print(f"({toolz.file.human_size(report.get('written', 0))} new)", end=" ")
+    print(f"with {ecol}{len(errors)}{c0} error(s)\n")
+
+
+def restore_from_store(dst_folder, bkp_name):
+    store_folder = f"{dst_folder}/store"
+    available = toolz.store.snapshots(store_folder)
 
-    err_cfg = 0
+    if bkp_name not in available:
+        print(f"{error} No snapshot '{bkp_name}' in '{store_folder}'")
+        print(f"{ci}Available snapshots{c0}: {', '.join(available)}\n")
+        exit(1)
 
-    for bkp_src in cfg_files:
-        if os.path.exists(bkp_src):
-            err_cfg += rsync_bkp(bkp_src, bkp_folder)
+    failures = toolz.store.restore(store_folder, bkp_name, bkp_name)
 
-    if err_cfg == 0:
+    if failures == 0:
         ecol = "\33[32m"
     else:
         ecol = "\33[31m"
 
-    cfg_bkp_ret = f"{done} Config files backuped in '{bkp_folder}' with "
-    cfg_bkp_ret += f"{ecol}{err_cfg}{c0} error(s)"
+    print(f"{done} Snapshot '{bkp_name}' restored in './{bkp_name}'", end=" ")
+    print(f"with {ecol}{failures}{c0} error(s)\n")
+
+
+def remote_writer(ssh_cmd, dst_folder, name, stdin):
+    """
+    Write file {name} of a remote destination from the {stdin} file
+    descriptor, through the shared SSH connection, the file getting its name
+    once complete
+    Return True on success
+    """
+
+    host, path = split_remote(dst_folder)
+    tgt = shlex.quote(f"{path}/{name}")
+    tmp = shlex.quote(f"{path}/{name}.tmp")
+
+    return toolz.run.run([*ssh_cmd, host, f"mkdir -p {shlex.quote(path)} &&"
+        f" cat > {tmp} && mv {tmp} {tgt}"], capture=True,
+        stdin=stdin).status == 0
+
+
+def backup_to_archive(dst_folder, jobs=None, compression="xz"):
+    today = datetime.datetime.today().strftime("%y%m%d")
+    bkp_name = f"{today}_{my_hostname}.tar.{compression}"
+    bkp_srcs = [bkp_src for srcs in backup_sources() for bkp_src in srcs]
+    remote = is_remote(dst_folder)
+    ssh_cmd = ssh_master(dst_folder) if remote else None
+    report = {}
+    progress = toolz.file.Progress(toolz.file.print_progress)
+    index = None
+
+    def send(read_fd):
+        # Closing the pipe once ssh is gone makes a pending write fail
+        try:
+            return remote_writer(ssh_cmd, dst_folder, bkp_name, read_fd)
+        finally:
+            os.close(read_fd)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as sender:
+        if remote:
+            read_fd, write_fd = os.pipe()
+            sending = sender.submit(send, read_fd)
+            out = open(write_fd, "wb")
+        else:
+            out = open(f"{dst_folder}/{bkp_name}.tmp", "wb")
 
-    print(cfg_bkp_ret)
+        try:
+            with out:
+                index, errors = toolz.archive.create(out, bkp_srcs,
+                        compression, jobs, report, progress)
+        except BrokenPipeError:
+            pass
 
-    for bkp_src in more_backups:
-        if os.path.exists(bkp_src):
-            err_other = 0
+        progress.finish()
 
-            err_other += rsync_bkp(bkp_src, bkp_folder)
+        if remote:
+            written = sending.result() and index is not None
+        else:
+            os.replace(f"{dst_folder}/{bkp_name}.tmp",
+                    f"{dst_folder}/{bkp_name}")
+            written = True
 
-            if err_other == 0:
-                ecol = "\33[32m"
+    if written:
+        with tempfile.TemporaryDirectory(prefix="toolz-backup-") as tmp_dir:
+            index_file = f"{tmp_dir}/{bkp_name}.idx"
+            toolz.archive.write_index(index_file, index)
+
+            if not remote:
+                shutil.move(index_file, f"{dst_folder}/{bkp_name}.idx")
             else:
-                ecol = "\33[31m"
+                with open(index_file, "rb") as f:
+                    written = remote_writer(ssh_cmd, dst_folder,
+                            f"{bkp_name}.idx", f.fileno())
 
-            more_bkp_ret = f"{done} '{bkp_src}' backuped in '{bkp_folder}'"
-            more_bkp_ret += f"with {ecol}{err_other}{c0} error(s)"
+    if remote:
+        ssh_master_exit(dst_folder, ssh_cmd)
 
-            print(more_bkp_ret)
+    if not written:
+        print(f"{error} Failed to write '{bkp_name}' in '{dst_folder}'\n")
+        exit(1)
+
+    for path, message in errors.items():
+        print(f"{warning} '{path}' failed: {message}")
+
+    if not errors:
+        ecol = "\33[32m"
+    else:
+        ecol = "\33[31m"
+
+    print(f"{done} {toolz.file.human_size(report.get('bytes', 0))} archived",
+            end=" ")
+    print(f"in '{dst_folder}/{bkp_name}'", end=" ")
+    print(f"({toolz.file.human_size(report.get('written', 0))})", end=" ")
+    print(f"with {ecol}{len(errors)}{c0} error(s)\n")
+
+
+def extract_from_archive(archive, path):
+    if not os.path.isfile(f"{archive}.idx"):
+        print(f"{error} No index '{archive}.idx' found\n")
+        exit(1)
+
+    extracted = toolz.archive.extract(archive, path, ".")
+
+    if extracted == 0:
+        print(f"{error} '{path}' not found in '{archive}'\n")
+        exit(1)
+
+    print(f"{done} {extracted} element(s) extracted from '{archive}'\n")
 
-    print()
+
+def option_value(args, opts, convert=int):
+    """
+    Remove an option and its value from {args}, return converted value
+    Return None if the option is absent
+    """
+
+    for opt in opts:
+        if opt in args:
+            index = args.index(opt)
+
+            try:
+                value = convert(args[index + 1])
+            except (IndexError, ValueError):
+                print(f"{error} Bad value for '{opt}'\n")
+                usage(1)
+
+            if isinstance(value, int) and value < 0:
+                print(f"{error} Bad value for '{opt}'\n")
+                usage(1)
+
+            del args[index:index + 2]
+
+            return value
+
+    return None
 
 
 if __name__ == "__main__":
     my_hostname = socket.gethostname()
+    my_user = getpass.getuser()
+    my_home = pathlib.Path.home()
+    args = sys.argv[1:]
 
-    if any(arg in sys.argv for arg in ["-h","--help"]):
+    if any(arg in args for arg in ["-h","--help"]):
         usage()
-    elif len(sys.argv) == 2 and test_backupfolder(sys.argv[1]):
-        dst_folder == sys.argv[1]
-    elif len(sys.argv) > 1:
+
+    jobs = option_value(args, ["-j", "--jobs"])
+
+    if jobs == 0:
+        print(f"{error} Bad jobs number\n")
+        usage(1)
+    keep_daily = option_value(args, ["--keep-daily"])
+    keep_monthly = option_value(args, ["--keep-monthly"])
+    restore = option_value(args, ["--restore"], str)
+    snapshot = any(arg in args for arg in ["-s", "--snapshot"])
+    store = "--store" in args
+    extract = option_value(args, ["--extract"], str)
+    archive = any(arg in args for arg in ["-a", "--archive"])
+    compression = "gz" if "--gzip" in args else "xz"
+    args = [arg for arg in args if arg not in ["-s", "--snapshot", "--store",
+        "-a", "--archive", "--gzip"]]
+
+    if restore is not None and not store:
+        print(f"{error} Only store snapshots can be restored\n")
+        usage(1)
+
+    if not snapshot and (keep_daily is not None or keep_monthly is not None):
+        print(f"{error} Retention only applies to snapshots\n")
+        usage(1)
+
+    if extract is not None and len(args) != 1:
+        print(f"{error} Archive to extract from is needed\n")
+        usage(1)
+
+    if len(args) == 1:
+        dst_folder = args[0]
+    elif len(args) > 1:
         print(f"{error} Bad argument\n")
         usage(1)
     else:
@@ -175,9 +715,21 @@ if __name__ == "__main__":
         else:
             dst_folder = input("Destination ? ")
 
-    if test_backupfolder(dst_folder):
+    if extract is not None:
+        extract_from_archive(dst_folder, extract)
+    elif store and is_remote(dst_folder):
+        print(f"{error} Store has to be a local folder\n")
+        exit(1)
+    elif restore is not None:
+        restore_from_store(dst_folder, restore)
+    elif store and test_backupfolder(dst_folder):
+        backup_to_store(dst_folder, jobs or None)
+    elif archive and test_backupfolder(dst_folder):
+        backup_to_archive(dst_folder, jobs or None, compression)
+    elif test_backupfolder(dst_folder):
         req_pkgs = ["rsync"]
 
         toolz.pkg.prerequisites(req_pkgs)
 
-        backup_to(dst_folder)
+        backup_to(dst_folder, jobs or default_jobs, snapshot, keep_daily,
+                keep_monthly)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import toolz
+
+__description__ = "Benchmark toolz.file operations on synthetic trees"
+__author__ = "Choops <choopsbd@gmail.com>"
+
+c0 = "\33[0m"
+ce = "\33[31m"
+cok = "\33[32m"
+cw = "\33[33m"
+ci = "\33[36m"
+
+error = f"{ce}E{c0}:"
+done = f"{cok}OK{c0}:"
+warning = f"{cw}W{c0}:"
+
+mib = 1 << 20
+gib = 1 << 30
+
+default_output = "bench_file.json"
+
+
+def usage(err_code=0):
+    my_script = os.path.basename(__file__)
+    print(f"{ci}{__description__}\nUsage{c0}:")
+    print(f"  {my_script} [OPTION] [SCALE (default: 1.0)]")
+    print(f"{ci}Options{c0}:")
+    print(f"  -o,--output <FILE>: Write JSON results to FILE", end="")
+    print(f" (default: {default_output})")
+    print(f"  -h,--help: Print this help\n")
+    exit(err_code)
+
+
+def make_tiny(root, files=100000, per_dir=1000):
+    """
+    Create {files} files of a few bytes, {per_dir} per folder
+    """
+
+    for i in range(files):
+        if i % per_dir == 0:
+            folder = f"{root}/d{i // per_dir:04d}"
+            os.makedirs(folder)
+
+        with open(f"{folder}/f{i:06d}", "wb") as f:
+            f.write(b"%d\n" % i)
+
+
+def make_deep(root, depth=200, per_level=10):
+    """
+    Create a single {depth} levels deep branch, {per_level} files per level
+    """
+
+    folder = root
+
+    for level in range(depth):
+        folder = f"{folder}/l{level:03d}"
+        os.makedirs(folder)
+
+        for i in range(per_level):
+            with open(f"{folder}/f{i}", "wb") as f:
+                f.write(os.urandom(512))
+
+
+def make_sparse(root, files=3, size=4 * gib, data_ratio=0.01, extent=mib):
+    """
+    Create {files} sparse files of {size} bytes, {data_ratio} of it data
+    """
+
+    os.makedirs(root)
+    step = max(int(extent / data_ratio), extent)
+    chunk = os.urandom(extent)
+
+    for i in range(files):
+        with open(f"{root}/disk{i}.img", "wb") as f:
+            f.truncate(size)
+
+            for offset in range(0, size - extent + 1, step):
+                f.seek(offset)
+                f.write(chunk)
+
+
+def make_symlinks(root, entries=20000, per_dir=500):
+    """
+    Create a mix of files and relative, absolute and dangling symlinks
+    """
+
+    for i in range(entries):
+        if i % per_dir == 0:
+            folder = f"{root}/d{i // per_dir:03d}"
+            os.makedirs(folder)
+
+        kind = i % 4
+        path = f"{folder}/e{i:06d}"
+
+        if kind == 0:
+            with open(path, "wb") as f:
+                f.write(os.urandom(64))
+        elif kind == 1:
+            os.symlink(f"e{i - 1:06d}", path)
+        elif kind == 2:
+            os.symlink(f"{folder}/e{i - 2:06d}", path)
+        else:
+            os.symlink(f"missing{i:06d}", path)
+
+
+def timed(func, *args, **kwargs):
+    """
+    Return (wall seconds, result) of a call
+    """
+
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+
+    return time.perf_counter() - start, result
+
+
+def bench_tree(src, work):
+    """
+    Time toolz.file operations on a tree, return {operation: measures}
+    """
+
+    results = {}
+    uid, gid = os.getuid(), os.getgid()
+
+    def record(name, func, *args, **kwargs):
+        report = kwargs.setdefault("report", {})
+        wall, result = timed(func, *args, **kwargs)
+        results[name] = {"seconds": round(wall, 4), "success": bool(result),
+                "report": report}
+
+    record("rcopy", toolz.file.rcopy, src, f"{work}/rcopy")
+    record("rcopy (again)", toolz.file.rcopy, src, f"{work}/rcopy")
+    record("rcopy manifest", toolz.file.rcopy, src, f"{work}/rcopy_mf",
+            manifest=f"{work}/manifest.db")
+    record("rcopy manifest (again)", toolz.file.rcopy, src, f"{work}/rcopy_mf",
+            manifest=f"{work}/manifest.db")
+    record("overwrite", toolz.file.overwrite, src, f"{work}/overwrite")
+    record("overwrite sync", toolz.file.overwrite, src, f"{work}/sync",
+            sync=True)
+    record("overwrite sync (again)", toolz.file.overwrite, src, f"{work}/sync",
+            sync=True)
+
+    # Unprivileged, ownership can only be set to what it already is
+    record("rchown (unchanged)", toolz.file.rchown, f"{work}/sync", uid, gid)
+    record("rchmod", toolz.file.rchmod, f"{work}/sync", 0o600, 0o700)
+    record("rchmod (again)", toolz.file.rchmod, f"{work}/sync", 0o600, 0o700)
+    record("rchmod x4 jobs", toolz.file.rchmod, f"{work}/sync", 0o644, 0o755,
+            jobs=4)
+
+    for folder in os.listdir(work):
+        path = f"{work}/{folder}"
+
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    return results
+
+
+def bench_symlink_force(work, links=5000):
+    """
+    Time symlink_force() then symlink_many() creating then replacing {links}
+    links
+    """
+
+    os.makedirs(f"{work}/links")
+    results = {}
+
+    for name in ["symlink_force (new)", "symlink_force (existing)"]:
+        start = time.perf_counter()
+
+        for i in range(links):
+            toolz.file.symlink_force(f"/nowhere/{i}", f"{work}/links/l{i}")
+
+        results[name] = {"seconds": round(time.perf_counter() - start, 4),
+                "links": links}
+
+    shutil.rmtree(f"{work}/links")
+    os.makedirs(f"{work}/links")
+    wanted = {f"l{i}": f"/nowhere/{i}" for i in range(links)}
+
+    for name in ["symlink_many (new)", "symlink_many (existing)"]:
+        wall, _ = timed(toolz.file.symlink_many, wanted, f"{work}/links")
+        results[name] = {"seconds": round(wall, 4), "links": links}
+
+    shutil.rmtree(f"{work}/links")
+
+    return results
+
+
+def git_version():
+    """
+    Return current commit of the repository, if any
+    """
+
+    repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+    return toolz.run.output(["git", "-C", repo_dir, "describe", "--always",
+        "--dirty"]).strip() or None
+
+
+if __name__ == "__main__":
+    if any(arg in sys.argv for arg in ["-h","--help"]):
+        usage()
+
+    args = sys.argv[1:]
+    output = default_output
+
+    for opt in ["-o", "--output"]:
+        if opt in args:
+            index = args.index(opt)
+
+            if index + 1 >= len(args):
+                print(f"{error} Missing output file\n")
+                usage(1)
+
+            output = args[index + 1]
+            del args[index:index + 2]
+
+    try:
+        scale = float(args[0]) if args else 1.0
+    except ValueError:
+        print(f"{error} Bad argument\n")
+        usage(1)
+
+    fixtures = {
+            "tiny": lambda root: make_tiny(root, int(100000 * scale)),
+            "deep": lambda root: make_deep(root, max(int(200 * scale), 1)),
+            "sparse": lambda root: make_sparse(root,
+                size=max(int(4 * gib * scale), 16 * mib)),
+            "symlinks": lambda root: make_symlinks(root, int(20000 * scale))
+            }
+
+    results = {"date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "version": git_version(), "python": platform.python_version(),
+            "system": platform.platform(), "scale": scale, "fixtures": {}}
+
+    with tempfile.TemporaryDirectory(prefix="toolz-bench-") as root:
+        for name, make in fixtures.items():
+            src = f"{root}/{name}"
+            work = f"{root}/work"
+            os.makedirs(work)
+
+            print(f"{ci}Generating '{name}' fixture{c0}...")
+            make(src)
+            files, size = toolz.file.prescan(src)
+            print(f"  {files} files, {size // mib} MiB")
+
+            measures = bench_tree(src, work)
+            results["fixtures"][name] = {"files": files, "bytes": size,
+                    "results": measures}
+
+            for op, measure in measures.items():
+                print(f"  {op:<26} {measure['seconds']:>10.3f} s")
+
+            shutil.rmtree(src)
+            shutil.rmtree(work)
+
+        print(f"{ci}symlink_force{c0}:")
+        os.makedirs(f"{root}/work")
+        results["symlink_force"] = bench_symlink_force(f"{root}/work",
+                max(int(5000 * scale), 1))
+
+        for op, measure in results["symlink_force"].items():
+            print(f"  {op:<26} {measure['seconds']:>10.3f} s")
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{done} Results written to '{output}'\n")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+
+__description__ = "Check toolz import time against a budget"
+__author__ = "Choops <choopsbd@gmail.com>"
+
+c0 = "\33[0m"
+ce = "\33[31m"
+cok = "\33[32m"
+cw = "\33[33m"
+ci = "\33[36m"
+
+error = f"{ce}E{c0}:"
+done = f"{cok}OK{c0}:"
+warning = f"{cw}W{c0}:"
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Cumulative import time budgets in microseconds
+budgets = {
+        "import toolz": ("toolz", 10000),
+        "import toolz.file": ("toolz.file", 50000),
+        "import toolz.git": ("toolz.git", 50000)
+        }
+
+# Modules that must not be imported as a side effect
+forbidden = ["toolz.pkg", "toolz.syst", "toolz.agent"]
+
+
+def usage(err_code=0):
+    my_script = os.path.basename(__file__)
+    print(f"{ci}{__description__}\nUsage{c0}:")
+    print(f"  {my_script} [OPTION]")
+    print(f"{ci}Options{c0}:")
+    print(f"  -h,--help: Print this help\n")
+    exit(err_code)
+
+
+def import_times(statement):
+    """
+    Return {module: cumulative microseconds} from '-X importtime' output
+    """
+
+    cmd = [sys.executable, "-X", "importtime", "-c", statement]
+    proc = subprocess.run(cmd, cwd=repo_dir, capture_output=True, text=True,
+            env={**os.environ, "TOOLZ_NO_AGENT": "1"})
+
+    times = {}
+
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, module = line[12:].split("|")
+        times[module.strip()] = int(cumulative)
+
+    return times
+
+
+def check_budgets():
+    failures = 0
+
+    for statement, (module, budget) in budgets.items():
+        times = min((import_times(statement) for _ in range(3)),
+                key=lambda t: t.get(module, 0))
+        spent = times.get(module, 0)
+        leaks = [m for m in forbidden if m in times]
+
+        if spent > budget or leaks:
+            failures += 1
+            print(f"{error} '{statement}': {spent}us (budget {budget}us)", end="")
+            print(f", imports {', '.join(leaks)}" if leaks else "")
+        else:
+            print(f"{done} '{statement}': {spent}us (budget {budget}us)")
+
+    print()
+
+    return failures
+
+
+if __name__ == "__main__":
+    if any(arg in sys.argv for arg in ["-h","--help"]):
+        usage()
+    elif len(sys.argv) > 1:
+        print(f"{error} Bad argument\n")
+        usage(1)
+
+    exit(1 if check_budgets() else 0)
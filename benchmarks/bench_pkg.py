@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+os.environ["TOOLZ_NO_AGENT"] = "1"
+
+import toolz
+
+__description__ = "Benchmark toolz.pkg against synthetic dpkg databases"
+__author__ = "Choops <choopsbd@gmail.com>"
+
+c0 = "\33[0m"
+ce = "\33[31m"
+cok = "\33[32m"
+cw = "\33[33m"
+ci = "\33[36m"
+
+error = f"{ce}E{c0}:"
+done = f"{cok}OK{c0}:"
+warning = f"{cw}W{c0}:"
+
+default_sizes = [2000, 20000, 100000]
+
+
+def usage(err_code=0):
+    my_script = os.path.basename(__file__)
+    print(f"{ci}{__description__}\nUsage{c0}:")
+    print(f"  {my_script} [OPTION] [SIZE...] (default: 2000 20000 100000)")
+    print(f"{ci}Options{c0}:")
+    print(f"  -h,--help: Print this help\n")
+    exit(err_code)
+
+
+def stanza(name, arch, status, version="1.0-1"):
+    return (f"Package: {name}\nStatus: {status}\nPriority: optional\n"
+            f"Section: misc\nInstalled-Size: 1234\n"
+            f"Maintainer: Synthetic <synthetic@example.org>\n"
+            f"Architecture: {arch}\nVersion: {version}\n"
+            f"Depends: libc6 (>= 2.31), libsynth{len(name) % 7}\n"
+            f"Description: synthetic package {name}\n"
+            f" Generated to benchmark package state handling.\n .\n"
+            f" It spans several lines like real descriptions do.\n\n")
+
+
+def generate_root(root, size, seed=0):
+    """
+    Generate '{root}/dpkg/status' and '{root}/lists' with {size} packages
+    Return installed package names
+    """
+
+    rand = random.Random(seed)
+    admindir = f"{root}/dpkg"
+    lists = f"{root}/lists"
+
+    os.makedirs(admindir)
+    os.makedirs(lists)
+
+    installed = []
+    archive = []
+
+    with open(f"{admindir}/status", "w") as f:
+        f.write(stanza("dpkg", "amd64", "install ok installed"))
+
+        for i in range(size):
+            name = f"pkg-{i:06d}"
+            arch = rand.choice(["amd64"] * 8 + ["all"] * 3 + ["i386"])
+            draw = rand.random()
+
+            if draw < 0.05:
+                status = "deinstall ok config-files"
+            elif draw < 0.07:
+                status = "hold ok installed"
+            else:
+                status = "install ok installed"
+
+            f.write(stanza(name, arch, status))
+
+            if status.endswith(" installed"):
+                installed.append(name)
+
+            if rand.random() < 0.97:
+                archive.append((name, arch))
+
+    for i in range(size // 2):
+        archive.append((f"extra-{i:06d}", "amd64"))
+
+    release = f"{lists}/deb.example.org_debian_dists_synth_InRelease"
+    packages = f"{lists}/deb.example.org_debian_dists_synth_main_binary-amd64_Packages"
+
+    with open(release, "w") as f:
+        f.write("Origin: Debian\nLabel: Debian\nSuite: stable\n")
+        f.write("Codename: synth\nArchitectures: amd64 i386\n")
+
+    with open(packages, "w") as f:
+        for name, arch in archive:
+            f.write(stanza(name, arch, "install ok installed").replace(
+                "Status: install ok installed\n", f"Filename: pool/{name}.deb\n"))
+
+    return installed
+
+
+def best_of(func, repeat=5):
+    """
+    Return best wall time of {repeat} calls to {func}
+    """
+
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def bench_size(size):
+    with tempfile.TemporaryDirectory(prefix="toolz-bench-") as root:
+        installed = generate_root(root, size)
+        req_pkgs = random.Random(1).sample(installed, 60)
+
+        toolz.pkg.set_admindir(f"{root}/dpkg", f"{root}/lists")
+
+        def cold_is_installed():
+            toolz.pkg.set_admindir(f"{root}/dpkg")
+            toolz.pkg.is_installed(req_pkgs[0])
+
+        results = {
+                "is_installed (cold)": best_of(cold_is_installed, 3),
+                "is_installed x60": best_of(
+                    lambda: [toolz.pkg.is_installed(p) for p in req_pkgs]),
+                "prerequisites x60": best_of(
+                    lambda: toolz.pkg.prerequisites(req_pkgs, strict=False)),
+                "clean rc scan": best_of(
+                    lambda: toolz.pkg.pkgs_in_state("config-files")),
+                "obsoletes": best_of(toolz.pkg.obsolete_pkgs, 3)
+                }
+
+    return results
+
+
+if __name__ == "__main__":
+    if any(arg in sys.argv for arg in ["-h","--help"]):
+        usage()
+
+    try:
+        sizes = [int(arg) for arg in sys.argv[1:]] or default_sizes
+    except ValueError:
+        print(f"{error} Bad argument\n")
+        usage(1)
+
+    for size in sizes:
+        print(f"{ci}{size} packages{c0}:")
+
+        for name, timing in bench_size(size).items():
+            print(f"  {name:<22} {timing * 1000:>10.2f} ms")
+
+    print()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import toolz
+
+__description__ = "Benchmark toolz.file copies of sparse files"
+__author__ = "Choops <choopsbd@gmail.com>"
+
+c0 = "\33[0m"
+ce = "\33[31m"
+cok = "\33[32m"
+cw = "\33[33m"
+ci = "\33[36m"
+
+error = f"{ce}E{c0}:"
+done = f"{cok}OK{c0}:"
+warning = f"{cw}W{c0}:"
+
+mib = 1 << 20
+
+
+def usage(err_code=0):
+    my_script = os.path.basename(__file__)
+    print(f"{ci}{__description__}\nUsage{c0}:")
+    print(f"  {my_script} [OPTION] [SIZE_MB (default: 4096)] [DATA_% (default: 8)]")
+    print(f"{ci}Options{c0}:")
+    print(f"  -h,--help: Print this help\n")
+    exit(err_code)
+
+
+def make_sparse(path, size, data_ratio, extent=mib):
+    """
+    Create a file of {size} bytes holding data in {data_ratio} of it, spread
+    in {extent} sized chunks, the rest being holes
+    """
+
+    step = max(int(extent / data_ratio), extent)
+    chunk = os.urandom(extent)
+
+    with open(path, "wb") as f:
+        f.truncate(size)
+
+        for offset in range(0, size - extent + 1, step):
+            f.seek(offset)
+            f.write(chunk)
+
+
+def data_extents(path):
+    """
+    Return bytes of {path} held in data extents (SEEK_DATA/SEEK_HOLE)
+    """
+
+    data = 0
+
+    with open(path, "rb") as f:
+        fd = f.fileno()
+        size = os.fstat(fd).st_size
+        offset = 0
+
+        while offset < size:
+            try:
+                start = os.lseek(fd, offset, os.SEEK_DATA)
+            except OSError:
+                break
+
+            offset = os.lseek(fd, start, os.SEEK_HOLE)
+            data += offset - start
+
+    return data
+
+
+def shutil_copy(src, dst):
+    """
+    shutil.copy, return bytes it read: all of the apparent size, holes
+    being read as zeros
+    """
+
+    shutil.copy(src, dst)
+
+    return os.path.getsize(src)
+
+
+def toolz_copy(src, dst, report):
+    """
+    toolz.file.copy_file, return bytes it read as counted in {report}
+    (none for a reflink, which shares extents)
+    """
+
+    copied = report.get("bytes", 0)
+    toolz.file.copy_file(src, dst, report)
+
+    return report["bytes"] - copied
+
+
+def measure(copy, src, dst):
+    """
+    Return (wall seconds, bytes read, bytes written, allocated bytes) of a
+    copy, bytes written being data extents of the copy
+    /proc/self/io counters are not used: they miss reflink copies, and
+    copy_file_range ones on some filesystems, done in the kernel
+    """
+
+    start = time.perf_counter()
+
+    read = copy(src, dst)
+
+    wall = time.perf_counter() - start
+    written = data_extents(dst)
+    allocated = os.stat(dst).st_blocks * 512
+    os.remove(dst)
+
+    return wall, read, written, allocated
+
+
+if __name__ == "__main__":
+    if any(arg in sys.argv for arg in ["-h","--help"]):
+        usage()
+
+    try:
+        size = int(sys.argv[1]) * mib if len(sys.argv) > 1 else 4096 * mib
+        data_ratio = float(sys.argv[2]) / 100 if len(sys.argv) > 2 else 0.08
+    except ValueError:
+        print(f"{error} Bad argument\n")
+        usage(1)
+
+    with tempfile.TemporaryDirectory(prefix="toolz-bench-") as root:
+        src = f"{root}/disk.img"
+        make_sparse(src, size, data_ratio)
+        data = os.stat(src).st_blocks * 512
+
+        print(f"{ci}Apparent size{c0}: {size // mib} MiB, ", end="")
+        print(f"{ci}data{c0}: {data // mib} MiB")
+        print(f"{ci}{'Method':<22} {'Time(s)':>8} {'Read(MiB)':>10}", end="")
+        print(f" {'Written(MiB)':>13} {'Allocated(MiB)':>15} {'Sparse':>7}{c0}")
+
+        report = {}
+        copies = {
+                "shutil.copy": shutil_copy,
+                "toolz.file.copy_file": lambda s, d: toolz_copy(s, d, report)
+                }
+
+        for name, copy in copies.items():
+            wall, read, written, allocated = measure(copy, src, f"{root}/copy")
+            sparse = "yes" if allocated < size else "no"
+            print(f"{name:<22} {wall:>8.2f} {read / mib:>10.1f}", end="")
+            print(f" {written / mib:>13.1f} {allocated / mib:>15.1f}", end="")
+            print(f" {sparse:>7}")
+
+        print(f"{ci}toolz.file report{c0}: {report}\n")
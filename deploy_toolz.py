@@ -30,23 +30,25 @@ def usage(err_code=0):
 
 def deploy_scripts(src, tgt):
     not_to_deploy = ["xfce_init"]
+    links = {}
 
-    for ext in [".py", ".sh"]:
-        scripts = [f.replace(ext, "") for f in os.listdir(src) if f.endswith(ext)]
+    for script_file in os.listdir(src):
+        script, ext = os.path.splitext(script_file)
 
-        for script in not_to_deploy:
-            if script in scripts:
-                scripts.remove(script)
+        if ext in [".py", ".sh"] and script not in not_to_deploy:
+            links[script] = os.path.join(src, script_file)
 
-        for script in scripts:
-            script_tgt = f"{os.path.join(src, script)}{ext}"
-            script_lnk = f"{os.path.join(tgt, script)}"
+    report = {}
+    changes = toolz.file.symlink_many(links, tgt, owned=src, report=report)
 
-            toolz.file.symlink_force(script_tgt, script_lnk)
+    for action, script in changes or []:
+        print(f"{done} '{script}' {action} in '{tgt}'")
 
-            print(f"{done} '{script}' deployed in '/usr/local/bin'")
+    if changes is None:
+        print(f"{error} {report['errors']} script(s) could not be deployed")
 
-    print()
+    print(f"{done} {len(links)} scripts deployed in '{tgt}'", end="")
+    print(f" ({report.get('unchanged', 0)} already up to date)\n")
 
 
 if __name__ == "__main__":
@@ -8,6 +8,8 @@ import socket
 import fcntl
 import struct
 
+import toolz
+
 __description__ = "Show network informations"
 __author__ = "Choops <choopsbd@gmail.com>"
 
@@ -70,15 +72,19 @@ def get_ip(ifname):
 
 
 def get_gw():
-    get_gw_cmd = "ip r | grep default | awk '{print $3}'"
+    route = toolz.run.output(["ip", "route", "show", "default"], timeout=5)
 
-    return os.popen(get_gw_cmd).read().rstrip("\n")
+    return route.split()[2] if len(route.split()) > 2 else ""
 
 
 def get_dns():
-    get_dns_cmd = "dig | awk -F'(' '/SERVER:/{print $2}' | sed 's/.$//'"
+    dig_out = toolz.run.output(["dig"], timeout=10)
+
+    for line in dig_out.split("\n"):
+        if "SERVER:" in line and "(" in line:
+            return line.split("(")[1].split(")")[0]
 
-    return os.popen(get_dns_cmd).read().rstrip(")\n")
+    return ""
 
 
 def list_ifaces():
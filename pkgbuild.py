@@ -33,12 +33,9 @@ def build_deb_package(folder):
     my_user = pathlib.Path(folder).owner()
     my_group = pathlib.Path(folder).group()
 
-    toolz.file.rchown(folder, "root", "root")
-
-    os.system(f"dpkg-deb --build {folder}")
-
-    for target in [folder, f"{folder}.deb"]:
-        toolz.file.rchown(target, my_user, my_group)
+    # Files are recorded as root's without changing them on disk
+    toolz.run.run(["dpkg-deb", "--root-owner-group", "--build", folder])
+    toolz.file.rchown(f"{folder}.deb", my_user, my_group)
 
     dest_folder = os.path.abspath(pathlib.Path(folder).parent)
     pkg_name = os.path.basename(folder)
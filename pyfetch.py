@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import sys
-import apt
 import os
 import shutil
 import getpass
@@ -11,6 +10,8 @@ import subprocess
 import datetime
 import pathlib
 
+import toolz
+
 __description__ = "Fetch system informations"
 __author__ = "Choops <choopsbd@gmail.com>"
 
@@ -145,11 +146,7 @@ def get_packages(dist):
     dist_ok = ["debian", "raspbian", "ubuntu"]
 
     if dist in dist_ok:
-        list_cmd = ['dpkg', '-l']
-        count_cmd = ['grep', '-c', '^i']
-        pkg_list = subprocess.Popen(list_cmd, stdout=subprocess.PIPE)
-        pkg_count = subprocess.check_output(count_cmd, stdin=pkg_list.stdout,
-                universal_newlines=True).rstrip("\n")
+        pkg_count = toolz.pkg.installed_count()
 
     return f"{CYN}Packages{DEF}:  {pkg_count}"
 
@@ -173,17 +170,18 @@ def get_shell():
 def get_term():
     term = "N/A"
 
-    get_term_cmd = "cat /etc/alternatives/x-terminal-emulator | grep exec"
-
-    term_bin = os.popen(get_term_cmd).read().rstrip()
+    term_cmd = "x-terminal-emulator"
 
-    if term_bin:
-        term_cmd = term_bin.split("'")[1]
-    else:
-        term_cmd = "x-terminal-emulator"
+    try:
+        with open("/etc/alternatives/x-terminal-emulator", "r",
+                errors="replace") as f:
+            for line in f:
+                if "exec" in line and "'" in line:
+                    term_cmd = line.split("'")[1]
+    except OSError:
+        pass
 
-    term_vers_cmd = f"{term_cmd} --version"
-    term = os.popen(term_vers_cmd).read().rstrip()
+    term = toolz.run.output([term_cmd, "--version"], timeout=5).rstrip()
     if "\n" in term:
         term = term.partition('\n')[0]
 
@@ -200,8 +198,8 @@ def get_de():
             de = "N/A"
 
     if de == "XFCE":
-        get_xfce_version = "xfce4-about -V 2>/dev/null"
-        for line in os.popen(get_xfce_version).read().split("\n"):
+        get_xfce_version = ["xfce4-about", "-V"]
+        for line in toolz.run.output(get_xfce_version, timeout=5).split("\n"):
             if line.startswith("xfce4-about"):
                 de = line.split("(")[1][:-1]
 
@@ -272,12 +270,11 @@ def get_cpu():
 
 
 def get_gpu():
-    pci_list_cmd = ['lspci']
-    filter_cmd = ['grep', 'VGA']
-    pci_info = subprocess.Popen(pci_list_cmd, stdout=subprocess.PIPE)
-    gpu_info = subprocess.check_output(filter_cmd, stdin=pci_info.stdout,
-            universal_newlines=True).rstrip("\n")
-    gpu = gpu_info.split(": ")[1]
+    gpu = "N/A"
+
+    for line in toolz.run.output(["lspci"], timeout=10).split("\n"):
+        if "VGA" in line:
+            gpu = line.split(": ")[1]
 
     return f"{CYN}GPU{DEF}:    {gpu}"
 
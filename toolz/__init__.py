@@ -1,12 +1,26 @@
 #!/usr/bin/env python3
 
-from . import conf
-from . import file
-from . import git
-from . import pkg
-from . import syst
-from . import user
+import importlib
+
 from .base import yesno
 
 __description__ = "Library dedicated to git://choopsit/toolz"
 __author__ = "Choops <choopsbd@gmail.com>"
+
+# Submodules are imported on first attribute access (PEP 562)
+submodules = ["agent", "aptlists", "archive", "conf", "file", "git", "pkg", "run",
+        "store", "syst", "user"]
+
+
+def __getattr__(name):
+    if name in submodules:
+        module = importlib.import_module(f".{name}", __name__)
+        globals()[name] = module
+
+        return module
+
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(submodules))
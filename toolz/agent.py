@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+
+__description__ = "Resident agent keeping system facts warm module"
+__author__ = "Choops <choopsbd@gmail.com>"
+
+c0 = "\33[0m"
+ce = "\33[31m"
+cok = "\33[32m"
+cw = "\33[33m"
+ci = "\33[36m"
+
+error = f"{ce}E{c0}:"
+done = f"{cok}OK{c0}:"
+warning = f"{cw}W{c0}:"
+
+# Files a fact depends on: cached value is recomputed when one of them changes
+watched_files = {
+        "distro": ["/etc/os-release"],
+        "codename": ["/etc/os-release", "/var/lib/apt/lists"],
+        "is_vm": [],
+        "users": ["/etc/passwd", "/home"],
+        "groups": ["/etc/group"],
+        "resolve": ["/var/lib/dpkg/status"],
+        "installed_count": ["/var/lib/dpkg/status"]
+        }
+
+_state = {"serving": False, "down": False}
+
+
+def socket_path():
+    """
+    Return agent socket path: per user runtime folder if available
+    """
+
+    if "TOOLZ_AGENT_SOCKET" in os.environ:
+        return os.environ["TOOLZ_AGENT_SOCKET"]
+
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR", "")
+
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return f"{runtime_dir}/toolz-agent.sock"
+
+    if os.getuid() == 0:
+        return "/run/toolz-agent.sock"
+
+    return f"/tmp/toolz-agent-{os.getuid()}.sock"
+
+
+def query(fact, *args, timeout=2):
+    """
+    Ask a fact to the agent
+    Raise OSError if agent is not running or not trustable
+    """
+
+    path = socket_path()
+    owner = os.stat(path).st_uid
+
+    if owner not in [0, os.getuid()]:
+        raise PermissionError(f"'{path}' is not owned by current user")
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps({"fact": fact, "args": args}).encode() + b"\n")
+
+        with sock.makefile("rb") as f:
+            answer = json.loads(f.readline() or b"{}")
+
+    if "value" not in answer:
+        raise OSError(answer.get("error", "empty answer from agent"))
+
+    return answer["value"]
+
+
+def ask(fact, compute, *args):
+    """
+    Return a fact from the agent if running, else compute it directly
+    """
+
+    if _state["serving"] or _state["down"] or "TOOLZ_NO_AGENT" in os.environ:
+        return compute(*args)
+
+    try:
+        return query(fact, *args)
+    except (OSError, ValueError):
+        _state["down"] = True
+
+    return compute(*args)
+
+
+def stamp(paths):
+    """
+    Return a change stamp (mtime, size) for a list of files
+    """
+
+    stamps = []
+
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamps.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamps.append(None)
+
+    return stamps
+
+
+def fact_computers():
+    """
+    Return direct computation function of each fact
+    """
+
+    from . import pkg
+    from . import syst
+    from . import user
+
+    return {
+            "distro": syst.compute_distro,
+            "codename": syst.compute_codename,
+            "is_vm": syst.compute_is_vm,
+            "users": user.compute_list,
+            "groups": user.compute_groups,
+            "resolve": pkg.compute_resolve,
+            "installed_count": pkg.compute_installed_count
+            }
+
+
+class FactHandler(socketserver.StreamRequestHandler):
+    """
+    Answer one json request line per connection
+    """
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            value = self.server.get_fact(request["fact"], request["args"])
+            answer = {"value": value}
+        except Exception as exc:
+            answer = {"error": f"{type(exc).__name__}: {exc}"}
+
+        self.wfile.write(json.dumps(answer).encode() + b"\n")
+
+
+class FactServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Unix socket server caching facts until their watched files change
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path):
+        self.computers = fact_computers()
+        self.cache = {}
+        super().__init__(path, FactHandler)
+
+    def get_fact(self, fact, args):
+        if fact not in self.computers:
+            raise KeyError(f"unknown fact '{fact}'")
+
+        key = json.dumps([fact, args])
+        new_stamp = stamp(watched_files[fact])
+        cached = self.cache.get(key)
+
+        if cached is None or cached[0] != new_stamp:
+            cached = (new_stamp, self.computers[fact](*args))
+            self.cache[key] = cached
+
+        return cached[1]
+
+
+def serve(path=None):
+    """
+    Run the agent until interrupted
+    """
+
+    path = path or socket_path()
+    _state["serving"] = True
+
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise FileExistsError(f"'{path}' exists and is not a socket")
+
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(path)
+            raise FileExistsError(f"An agent already listens on '{path}'")
+        except ConnectionRefusedError:
+            os.remove(path)
+
+    old_umask = os.umask(0o077)
+
+    try:
+        server = FactServer(path)
+    finally:
+        os.umask(old_umask)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
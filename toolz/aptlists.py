@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+import glob
+import gzip
+import lzma
+import mmap
+import os
+import re
+
+__description__ = "Indexed access to apt lists module"
+__author__ = "Choops <choopsbd@gmail.com>"
+
+c0 = "\33[0m"
+ce = "\33[31m"
+cok = "\33[32m"
+cw = "\33[33m"
+ci = "\33[36m"
+
+error = f"{ce}E{c0}:"
+done = f"{cok}OK{c0}:"
+warning = f"{cw}W{c0}:"
+
+lists_dir = "/var/lib/apt/lists"
+
+release_fields = ["Origin", "Label", "Suite", "Codename", "Version",
+        "Components", "Architectures"]
+
+package_re = re.compile(rb"^Package: *(\S+)", re.M)
+stanza_re = re.compile(rb"^Package: *(\S+)$.*?^Architecture: *(\S+)$",
+        re.M | re.S)
+
+_maps = {}
+
+
+def map_file(path):
+    """
+    Return a read-only memory map of a file, kept until the file changes
+    Return None for empty or unreadable files
+    """
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _maps.get(path)
+
+    if cached and cached["stamp"] == stamp:
+        return cached["map"]
+
+    if st.st_size == 0:
+        return None
+
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    _maps[path] = {"stamp": stamp, "map": mm, "offsets": None}
+
+    return mm
+
+
+def release_files(folder=None):
+    """
+    List 'Release' and 'InRelease' files in apt lists
+    """
+
+    folder = folder or lists_dir
+
+    return sorted(glob.glob(f"{folder}/*_Release") +
+            glob.glob(f"{folder}/*_InRelease"))
+
+
+def parse_release(path):
+    """
+    Return suite description fields of a 'Release' or 'InRelease' file
+    """
+
+    mm = map_file(path)
+    release = {}
+
+    if mm is None:
+        return release
+
+    for field in release_fields:
+        match = re.search(rb"^" + field.encode() + rb": *(.*?)\r?$", mm, re.M)
+
+        if match:
+            release[field] = match.group(1).decode(errors="replace")
+
+    return release
+
+
+def releases(folder=None):
+    """
+    List suite descriptions of every configured archive
+    """
+
+    return [parse_release(path) for path in release_files(folder)]
+
+
+def packages_files(folder=None):
+    """
+    List 'Packages' indexes in apt lists
+    """
+
+    folder = folder or lists_dir
+
+    return sorted(glob.glob(f"{folder}/*_Packages*"))
+
+
+def offsets(path):
+    """
+    Return {package: [stanza offsets]} for an uncompressed 'Packages' file
+    """
+
+    mm = map_file(path)
+
+    if mm is None:
+        return {}
+
+    cached = _maps[path]
+
+    if cached["offsets"] is None:
+        index = {}
+
+        for match in package_re.finditer(mm):
+            index.setdefault(match.group(1).decode(), []).append(match.start())
+
+        cached["offsets"] = index
+
+    return cached["offsets"]
+
+
+def read_stanza(mm, offset):
+    """
+    Parse the stanza starting at {offset} in a mapped index
+    """
+
+    end = mm.find(b"\n\n", offset)
+    end = len(mm) if end == -1 else end
+    stanza = {}
+    field = ""
+
+    for line in mm[offset:end].decode(errors="replace").split("\n"):
+        if line.startswith((" ", "\t")) and field:
+            stanza[field] += f"\n{line}"
+        elif ":" in line:
+            field, value = line.split(":", 1)
+            stanza[field] = value.strip()
+
+    return stanza
+
+
+def lookup(pkg, folder=None):
+    """
+    Return stanzas of package {pkg} in every uncompressed 'Packages' index
+    """
+
+    found = []
+
+    for path in packages_files(folder):
+        if not path.endswith("_Packages"):
+            continue
+
+        for offset in offsets(path).get(pkg, []):
+            found.append(read_stanza(_maps[path]["map"], offset))
+
+    return found
+
+
+def available_pkgs(folder=None):
+    """
+    Return the set of (package, arch) provided by any archive
+    Return None if an index can not be read, so that no caller takes a
+    package for obsolete by mistake
+    """
+
+    available = set()
+
+    for path in packages_files(folder):
+        if path.endswith("_Packages"):
+            mm = map_file(path)
+
+            if mm is None:
+                if os.path.isfile(path) and os.path.getsize(path) == 0:
+                    continue
+
+                return None
+
+            for match in stanza_re.finditer(mm):
+                available.add((match.group(1).decode(), match.group(2).decode()))
+        elif path.endswith((".gz", ".xz")):
+            opener = gzip.open if path.endswith(".gz") else lzma.open
+            name = arch = b""
+
+            try:
+                with opener(path, "rb") as f:
+                    for line in f:
+                        if line.startswith(b"Package:"):
+                            name = line[8:].strip()
+                        elif line.startswith(b"Architecture:"):
+                            arch = line[13:].strip()
+                        elif line == b"\n" and name:
+                            available.add((name.decode(), arch.decode()))
+                            name = arch = b""
+            except (OSError, EOFError, lzma.LZMAError):
+                return None
+
+            if name:
+                available.add((name.decode(), arch.decode()))
+        else:
+            return None
+
+    return available
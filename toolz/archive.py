@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+import bisect
+import gzip
+import io
+import json
+import lzma
+import os
+import stat
+import tarfile
+
+from . import file
+
+__description__ = "Block compressed tar archive module"
+__author__ = "Choops <choopsbd@gmail.com>"
+
+c0 = "\33[0m"
+ce = "\33[31m"
+cok = "\33[32m"
+cw = "\33[33m"
+ci = "\33[36m"
+
+error = f"{ce}E{c0}:"
+done = f"{cok}OK{c0}:"
+warning = f"{cw}W{c0}:"
+
+# Each block of the tar stream is compressed on its own, as a complete
+# gzip member or xz stream: concatenated, they still make a valid file for
+# tar, gzip and xz, and a member is read back decompressing its blocks only
+block_size = 8 << 20
+compressions = {"gz": 6, "xz": 6}
+
+
+def compress_block(data, compression):
+    """
+    Compress a block as a standalone gzip member or xz stream (run by worker
+    processes)
+    """
+
+    if compression == "xz":
+        return lzma.compress(data, preset=compressions["xz"])
+
+    return gzip.compress(data, compresslevel=compressions["gz"], mtime=0)
+
+
+def decompress_block(data, compression):
+    if compression == "xz":
+        return lzma.decompress(data)
+
+    return gzip.decompress(data)
+
+
+class BlockWriter:
+    """
+    File object cutting what is written in blocks compressed by {pool}, then
+    written in order to {out}
+    """
+
+    def __init__(self, out, pool, compression, jobs):
+        self.out = out
+        self.pool = pool
+        self.compression = compression
+        self.in_flight = (jobs or os.cpu_count() or 1) * 2
+        self.buf = bytearray()
+        self.raw_offset = 0
+        self.offset = 0
+        self.blocks = []
+        self.futures = []
+
+    def write(self, data):
+        self.buf += data
+
+        while len(self.buf) >= block_size:
+            self.submit(bytes(self.buf[:block_size]))
+            del self.buf[:block_size]
+
+        return len(data)
+
+    def submit(self, data):
+        self.futures.append((len(data), self.pool.submit(compress_block, data,
+            self.compression)))
+
+        # Blocks are written as they come, keeping memory bounded
+        while len(self.futures) > self.in_flight:
+            self.collect()
+
+    def collect(self):
+        raw_size, future = self.futures.pop(0)
+        packed = future.result()
+
+        self.out.write(packed)
+        self.blocks.append([self.raw_offset, self.offset, len(packed)])
+        self.raw_offset += raw_size
+        self.offset += len(packed)
+
+    def close(self):
+        """
+        Compress the last block and wait for all of them
+        Return [[uncompressed offset, offset, size]] of blocks
+        """
+
+        if self.buf:
+            self.submit(bytes(self.buf))
+            self.buf = bytearray()
+
+        while self.futures:
+            self.collect()
+
+        return self.blocks
+
+
+class PaddedFile:
+    """
+    Readable file giving exactly {size} bytes, padding with zeros a file
+    that shrank since its size was read or could not be read to the end,
+    so that its tar member keeps the size its header declares
+    """
+
+    def __init__(self, f, size):
+        self.f = f
+        self.left = size
+        self.error = None
+
+    def read(self, size=-1):
+        size = self.left if size < 0 else min(size, self.left)
+        data = b""
+
+        if self.error is None:
+            try:
+                data = self.f.read(size)
+            except OSError as exc:
+                self.error = exc.strerror
+
+            if len(data) < size and self.error is None:
+                self.error = "File shrank while archived"
+
+        if len(data) < size:
+            data += bytes(size - len(data))
+
+        self.left -= len(data)
+
+        return data
+
+
+def create(out, sources, compression="xz", jobs=None, report=None,
+        progress=None):
+    """
+    Write {sources} to {out} file object as a tar stream compressed by
+    blocks with {jobs} processes
+    Files archived are recorded in {progress}, a toolz.file.Progress, if any
+    Return (index, {path: error message}), index locating members and blocks
+    for extract()
+    """
+
+    # Imported here as only archive creation needs them
+    import concurrent.futures
+    import multiprocessing
+
+    report = {} if report is None else report
+    progress = progress or file.Progress()
+    errors = {}
+    members = []
+
+    def failed(path, message):
+        errors[path] = message
+        progress.add(path, failed=True)
+
+    # Forked workers would keep open the descriptors of the caller, such as
+    # the pipe {out} may be, which would then never report its reader gone
+    context = multiprocessing.get_context("forkserver")
+
+    with concurrent.futures.ProcessPoolExecutor(jobs,
+            mp_context=context) as pool:
+        writer = BlockWriter(out, pool, compression, jobs)
+
+        with tarfile.open(fileobj=writer, mode="w|",
+                format=tarfile.PAX_FORMAT) as tar:
+            for path, st in file.walk_sources(sources, failed):
+                # Devices, sockets and pipes are not backed up
+                if not (stat.S_ISREG(st.st_mode) or stat.S_ISDIR(st.st_mode) or
+                        stat.S_ISLNK(st.st_mode)):
+                    continue
+
+                start = tar.offset
+
+                try:
+                    info = tar.gettarinfo(path)
+                    f = open(path, "rb") if info.isreg() else None
+                except OSError as exc:
+                    failed(path, exc.strerror)
+                    continue
+
+                # Once its header is written, a member is always completed,
+                # failing to write the archive itself aborting it
+                if f is None:
+                    tar.addfile(info)
+
+                    if not info.isdir():
+                        progress.add(path)
+                else:
+                    with f:
+                        padded = PaddedFile(f, info.size)
+                        tar.addfile(info, padded)
+
+                    if padded.error is not None:
+                        errors[path] = padded.error
+
+                    report["bytes"] = report.get("bytes", 0) + info.size
+                    progress.add(path, info.size, padded.error is not None)
+
+                members.append({"p": info.name, "o": start, "e": tar.offset})
+
+        blocks = writer.close()
+
+    report["written"] = report.get("written", 0) + writer.offset
+    report["errors"] = len(errors)
+
+    return {"compression": compression, "blocks": blocks,
+            "members": members}, errors
+
+
+def write_index(path, index):
+    """
+    Write an archive index as gzipped JSON lines: header, blocks, members
+    """
+
+    with gzip.open(path, "wt") as f:
+        f.write(json.dumps({"compression": index["compression"]}) + "\n")
+
+        for block in index["blocks"]:
+            f.write(json.dumps({"b": block}) + "\n")
+
+        for member in index["members"]:
+            f.write(json.dumps(member, separators=(",", ":")) + "\n")
+
+
+def read_index(path):
+    index = {"blocks": [], "members": []}
+
+    with gzip.open(path, "rt") as f:
+        for line in f:
+            entry = json.loads(line)
+
+            if "b" in entry:
+                index["blocks"].append(entry["b"])
+            elif "p" in entry:
+                index["members"].append(entry)
+            else:
+                index.update(entry)
+
+    return index
+
+
+def read_range(archive, index, start, end):
+    """
+    Return bytes {start} to {end} of the tar stream, only decompressing
+    blocks holding them
+    """
+
+    blocks = index["blocks"]
+    first = bisect.bisect_right([b[0] for b in blocks], start) - 1
+    data = bytearray()
+
+    with open(archive, "rb") as f:
+        for raw_offset, offset, size in blocks[first:]:
+            if raw_offset >= end:
+                break
+
+            f.seek(offset)
+            data += decompress_block(f.read(size), index["compression"])
+
+    skip = start - blocks[first][0]
+
+    return bytes(data[skip:skip + end - start])
+
+
+def extract(archive, path, target, index_file=None):
+    """
+    Extract member {path} (and what is below it) of {archive} into {target}
+    folder, reading its index ({archive}.idx by default)
+    Return number of members extracted
+    """
+
+    index = read_index(index_file or f"{archive}.idx")
+    name = path.strip("/")
+    runs = []
+
+    for member in index["members"]:
+        if member["p"] != name and not member["p"].startswith(f"{name}/"):
+            continue
+
+        # Members following each other are read at once
+        if runs and runs[-1][1] == member["o"]:
+            runs[-1][1] = member["e"]
+            runs[-1][2] += 1
+        else:
+            runs.append([member["o"], member["e"], 1])
+
+    for start, end, _ in runs:
+        # Members with their headers make a tar archive by themselves
+        raw = read_range(archive, index, start, end)
+
+        with tarfile.open(fileobj=io.BytesIO(raw)) as tar:
+            # Archives are our own backups, restored as they were
+            if hasattr(tarfile, "fully_trusted_filter"):
+                tar.extraction_filter = tarfile.fully_trusted_filter
+
+            tar.extractall(target)
+
+    return sum(run[2] for run in runs)
@@ -1,7 +1,5 @@
 #!/usr/bin/env python3
 
-import re
-
 __description__ = "common functions module"
 __author__ = "Choops <choopsbd@gmail.com>"
 
@@ -31,7 +29,7 @@ def yesno(question, default="n"):
 
     if answer == "":
         answer = default.lower()
-    elif not re.match('^(y|yes|n|no)$', answer):
+    elif answer not in ["y", "yes", "n", "no"]:
         print(f"{error} Invalid answer '{answer}'")
         return yesno(question, default)
 
@@ -5,6 +5,7 @@ import shutil
 import urllib.request
 
 from . import file
+from . import run
 
 __description__ = "Configuration management module"
 __author__ = "Choops <choopsbd@gmail.com>"
@@ -49,8 +50,9 @@ def swap():
             with open(swap_conf, "a") as f:
                 f.write(f"{swapok_pattern}\n")
 
-    for swap_cmd in [f"sysctl -p {swap_conf}", "swapoff -av", "swapon -av"]:
-        os.system(swap_cmd)
+    for swap_cmd in [["sysctl", "-p", swap_conf], ["swapoff", "-av"],
+            ["swapon", "-av"]]:
+        run.run(swap_cmd)
 
 
 def ssh():
@@ -69,7 +71,20 @@ def ssh():
             f.write("# Allow root user to connect on ssh\n")
             f.write(f"{rootok_pattern}\n")
 
-        os.system("systemctl restart ssh")
+        run.run(["systemctl", "restart", "ssh"])
+
+
+def home_owned(home, *paths):
+    """
+    Give {paths} to owner of {home}, return (uid, gid) of owner
+    """
+
+    st = os.stat(home)
+
+    for path in paths:
+        os.chown(path, st.st_uid, st.st_gid, follow_symlinks=False)
+
+    return st.st_uid, st.st_gid
 
 
 def bash(home):
@@ -79,11 +94,14 @@ def bash(home):
 
     bash_src = f"{conf_srcfolder}/bash"
     bash_cfg = f"{home}/.config/bash"
+    uid, gid = home_owned(home)
 
-    file.overwrite(f"{bash_src}/profile", f"{home}/.profile")
+    file.overwrite(f"{bash_src}/profile", f"{home}/.profile", sync=True,
+            owner=uid, group=gid)
 
     if not os.path.isdir(bash_cfg):
         os.makedirs(bash_cfg)
+        home_owned(home, f"{home}/.config", bash_cfg)
 
     old_bashrc = f"{home}/.bashrc"
 
@@ -104,7 +122,7 @@ def bash(home):
 
     bashrc_tgt = f"{bash_cfg}/bashrc"
 
-    file.overwrite(bashrc_src, bashrc_tgt)
+    file.overwrite(bashrc_src, bashrc_tgt, sync=True, owner=uid, group=gid)
 
 
 def vim(home):
@@ -119,10 +137,11 @@ def vim(home):
         if os.path.isfile(vim_oldfile):
             os.remove(vim_oldfile)
 
-    if not os.path.isdir(vim_cfg):
-        os.makedirs(vim_cfg)
+    uid, gid = home_owned(home)
 
-    file.overwrite(vim_src, vim_cfg)
+    # vim-plug and plugins are downloaded in there, not deployed
+    file.overwrite(vim_src, vim_cfg, sync=True, keep=["autoload", "plugged"],
+            owner=uid, group=gid)
 
     plug_folder = f"{vim_cfg}/autoload"
 
@@ -134,6 +153,7 @@ def vim(home):
     plug_tgt = f"{plug_folder}/plug.vim"
 
     urllib.request.urlretrieve(plug_url, plug_tgt)
+    home_owned(home, plug_folder, plug_tgt)
 
     if home == "/root":
         vimrc = f"{vim_cfg}/vimrc"
@@ -146,7 +166,7 @@ def vim(home):
                 if not "gruvbox" in line:
                     newf.write(line)
 
-        os.system("vim +PlugInstall +qall")
+        run.run(["vim", "+PlugInstall", "+qall"])
 
 
 def root():
@@ -156,7 +176,7 @@ def root():
 
     bash("/root")
     vim("/root")
-    os.system("update-alternatives --set editor /usr/bin/vim.basic")
+    run.run(["update-alternatives", "--set", "editor", "/usr/bin/vim.basic"])
 
 
 def lightdm():
@@ -188,7 +208,7 @@ def networkmanager():
     """
 
     nw_conf = "/etc/network/interfaces"
-    iface = os.popen("ip r | grep default").read().split()[4]
+    iface = run.output(["ip", "route", "show", "default"], timeout=10).split()[4]
     tmp_file = "/tmp/interfaces"
 
     file.overwrite(nw_conf, tmp_file)
@@ -238,7 +258,7 @@ def transmissiond(user, home):
     Deploy transmission-deamon configuration with {user} as daemon user
     """
 
-    os.system("systemctl stop transmission-daemon")
+    run.run(["systemctl", "stop", "transmission-daemon"])
 
     tsmd_service_dir = "/etc/systemd/system/transmission-daemon.service.d/"
     tsmd_service_conf = f"{tsmd_confdir}/override.conf"
@@ -254,13 +274,13 @@ def transmissiond(user, home):
     if not os.path.isdir(tsmd_service_dir):
         os.makedirs(tsmd_service_dir)
 
-    os.system(f"systemctl {sysctl_cmds[-1]}")
+    run.run(["systemctl", *sysctl_cmds[-1].split()])
 
     with open(tsmd_service_conf, "w") as f:
         f.write(f"[Service]\nUser={user}\n")
 
     for sysctl_cmd in sysctl_cmds:
-        os.system(f"systemctl {sysctl_cmd}")
+        run.run(["systemctl", *sysctl_cmd.split()])
 
     if not os.path.isdir(tsmd_conf_dir):
         os.makedirs(tsmd_conf_dir)
@@ -278,7 +298,7 @@ def transmissiond(user, home):
                 newf.write(line)
 
     for sysctl_cmd[:-1] in sysctl_cmds:
-        os.system(f"systemctl {sysctl_cmd}")
+        run.run(["systemctl", *sysctl_cmd.split()])
 
 
 def gruvbox_gtk():
@@ -307,9 +327,11 @@ def xfce(home):
     """
 
     git_dir = f"{home}/Work/git"
+    uid, gid = home_owned(home)
 
     if not os.path.isdir(git_dir):
         os.makedirs(git_dir)
+        home_owned(home, f"{home}/Work", git_dir)
 
     conf_dict = {
             "Xfce": "xfce4",
@@ -323,9 +345,8 @@ def xfce(home):
         conf_src = f"{conf_srcfolder}/config/{soft_conf}"
         conf_tgt = f"{home}/.config/{soft_conf}"
 
-        if not os.path.exists(conf_tgt):
-            os.makedirs(conf_tgt)
-
-        file.overwrite(conf_src, conf_tgt)
+        file.overwrite(conf_src, conf_tgt, sync=True, owner=uid, group=gid)
 
         print(f"{done} {soft} configuration deployed in '{home}/.config'")
+
+    home_owned(home, f"{home}/.config")
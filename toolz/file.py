@@ -1,8 +1,18 @@
 #!/usr/bin/env python3
 
+import collections
+import errno
+import fcntl
+import functools
+import grp
+import heapq
 import os
+import pwd
 import shutil
+import stat
 import tempfile
+import threading
+import time
 
 __description__ = "File management functions module"
 __author__ = "Choops <choopsbd@gmail.com>"
@@ -17,6 +27,29 @@ error = f"{ce}E{c0}:"
 done = f"{cok}OK{c0}:"
 warning = f"{cw}W{c0}:"
 
+# Concurrent file copies, as small files copies are latency bound
+copy_jobs = 8
+
+# Reflink ioctl from linux/fs.h, then in-kernel copies tried in order,
+# falling back to the next one on these errors
+FICLONE = 0x40049409
+copy_chunk_size = 1 << 30
+kernel_copies = []
+
+if hasattr(os, "copy_file_range"):
+    kernel_copies.append(("copy_file_range", os.copy_file_range))
+
+if hasattr(os, "sendfile"):
+    kernel_copies.append(("sendfile",
+        lambda src_fd, dst_fd, size: os.sendfile(dst_fd, src_fd, None, size)))
+
+fallback_errnos = [errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+        errno.ENOTSUP, errno.EBADF, errno.EPERM]
+
+_report_lock = threading.Lock()
+
+subdir_flags = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW | os.O_CLOEXEC
+
 
 def symlink_force(target, link_name):
     """
@@ -41,88 +74,1184 @@ def symlink_force(target, link_name):
         raise
 
 
-def overwrite(src, tgt):
+def symlink_many(links, tgt_dir, owned=None, report=None):
+    """
+    Make {tgt_dir} hold {links} ({name: target}) reading it once: only links
+    missing or pointing elsewhere are (atomically) replaced, and dangling
+    links to targets inside {owned} folder are removed
+    Return [(action, name)] of changes, None if anything failed
+    """
+
+    changes = []
+    failures = 0
+    owned = os.path.join(owned, "") if owned else None
+    fd = os.open(tgt_dir, subdir_flags)
+
+    try:
+        existing = {}
+
+        with os.scandir(fd) as it:
+            for entry in it:
+                if entry.is_symlink():
+                    existing[entry.name] = os.readlink(entry.name, dir_fd=fd)
+                else:
+                    existing[entry.name] = None
+
+        for name, target in sorted(links.items()):
+            if existing.get(name, "") == target:
+                count(report, "unchanged")
+                continue
+
+            tmp_name = f".{name}.{os.getpid()}.tmp"
+
+            try:
+                try:
+                    os.symlink(target, tmp_name, dir_fd=fd)
+                except FileExistsError:
+                    os.remove(tmp_name, dir_fd=fd)
+                    os.symlink(target, tmp_name, dir_fd=fd)
+
+                os.replace(tmp_name, name, src_dir_fd=fd, dst_dir_fd=fd)
+            except OSError:
+                failures += 1
+
+                try:
+                    os.remove(tmp_name, dir_fd=fd)
+                except OSError:
+                    pass
+
+                continue
+
+            action = "updated" if name in existing else "added"
+            count(report, action)
+            changes.append((action, name))
+
+        for name, target in sorted(existing.items()):
+            if owned is None or target is None or name in links:
+                continue
+
+            target = os.path.join(tgt_dir, target)
+
+            if target.startswith(owned) and not os.path.lexists(target):
+                try:
+                    os.remove(name, dir_fd=fd)
+                except OSError:
+                    failures += 1
+                    continue
+
+                count(report, "removed")
+                changes.append(("removed", name))
+    finally:
+        os.close(fd)
+
+    count(report, "errors", failures)
+
+    return None if failures else changes
+
+
+def count(report, key, value=1):
+    """
+    Add {value} to {key} counter of a shared report dict, if any
+    """
+
+    if report is not None:
+        with _report_lock:
+            report[key] = report.get(key, 0) + value
+
+
+class Progress:
+    """
+    Thread-safe progress of a file operation: files, bytes, errors, current
+    path and rates, given to {callback} at most every {interval} seconds
+    With {total} (files, bytes) as returned by prescan(), an ETA is estimated
+    The {slowest} folders to go through are kept for the final summary
+    Operations given a Progress record paths below the root they were given
+    and leave calling finish() to whoever created it
+    """
+
+    def __init__(self, callback=None, interval=1.0, total=None, slowest=5):
+        self.callback = callback
+        self.interval = interval
+        self.total = total
+        self.slowest = slowest
+        self.start = time.monotonic()
+        self.last_call = self.start
+        self.files = 0
+        self.bytes = 0
+        self.errors = 0
+        self.path = ""
+        self.dirs = []
+        self.lock = threading.Lock()
+
+    def add(self, path, size=0, failed=False):
+        """
+        Record a processed file of {size} bytes
+        """
+
+        with self.lock:
+            self.files += 1
+            self.bytes += size
+            self.errors += failed
+            self.path = path
+            now = time.monotonic()
+            due = self.callback and now - self.last_call >= self.interval
+
+            if due:
+                self.last_call = now
+
+        if due:
+            self.callback(self.snapshot())
+
+    def add_dir(self, path, seconds, entries):
+        """
+        Record time spent going through a folder of {entries} entries
+        """
+
+        with self.lock:
+            heapq.heappush(self.dirs, (seconds, path, entries))
+
+            if len(self.dirs) > self.slowest:
+                heapq.heappop(self.dirs)
+
+    def snapshot(self):
+        """
+        Return current counters, rates in per second and ETA in seconds
+        """
+
+        with self.lock:
+            elapsed = time.monotonic() - self.start
+            snap = {"path": self.path, "files": self.files,
+                    "bytes": self.bytes, "errors": self.errors,
+                    "elapsed": elapsed,
+                    "files_per_s": self.files / elapsed if elapsed else 0.0,
+                    "bytes_per_s": self.bytes / elapsed if elapsed else 0.0,
+                    "eta": None}
+
+        if self.total:
+            total_files, total_bytes = self.total
+
+            if total_bytes and snap["bytes_per_s"]:
+                snap["eta"] = max(total_bytes - snap["bytes"], 0) / \
+                        snap["bytes_per_s"]
+            elif total_files and snap["files_per_s"]:
+                snap["eta"] = max(total_files - snap["files"], 0) / \
+                        snap["files_per_s"]
+
+        return snap
+
+    def finish(self):
+        """
+        Give last snapshot to callback, return a summary adding the slowest
+        folders as [(path, seconds, entries)]
+        """
+
+        summary = self.snapshot()
+
+        with self.lock:
+            summary["slowest_dirs"] = [(path, seconds, entries) for
+                    seconds, path, entries in sorted(self.dirs, reverse=True)]
+
+        if self.callback:
+            self.callback(summary)
+
+        return summary
+
+
+def human_size(size):
+    """
+    Return a size in bytes as a short human readable string
+    """
+
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if size < 1024:
+            return f"{size:.1f}{unit}" if unit != "B" else f"{size}{unit}"
+
+        size /= 1024
+
+    return f"{size:.1f}TiB"
+
+
+def print_progress(snap):
+    """
+    Progress callback printing snapshots on a single terminal line
+    """
+
+    line = f"{snap['files']} files ({human_size(snap['bytes'])}), " \
+            f"{snap['files_per_s']:.0f} files/s, " \
+            f"{human_size(int(snap['bytes_per_s']))}/s"
+
+    if snap["errors"]:
+        line += f", {ce}{snap['errors']} error(s){c0}"
+
+    if "slowest_dirs" in snap:
+        print(f"\r\33[K{done} {line} in {snap['elapsed']:.1f}s")
+
+        for path, seconds, entries in snap["slowest_dirs"]:
+            print(f"  {ci}{seconds:.2f}s{c0} in '{path}' ({entries} entries)")
+    else:
+        if snap["eta"] is not None:
+            line += f", ETA {snap['eta']:.0f}s"
+
+        print(f"\r\33[K{line} - {snap['path'][-40:]}", end="", flush=True)
+
+
+def prescan(path):
+    """
+    Return (files, bytes) below {path}, for Progress ETA
+    """
+
+    counter = Count()
+    walk(path, [counter])
+
+    return counter.counters.get("files", 0) + \
+            counter.counters.get("symlinks", 0), counter.counters.get("bytes", 0)
+
+
+def copy_extents(src_fd, dst_fd, size):
+    """
+    Copy only data extents of a sparse file, leaving holes unwritten
+    Return number of bytes copied
+    """
+
+    copied = 0
+    offset = 0
+
+    while offset < size:
+        try:
+            data = os.lseek(src_fd, offset, os.SEEK_DATA)
+        except OSError as exc:
+            if exc.errno == errno.ENXIO:
+                break
+            raise
+
+        hole = os.lseek(src_fd, data, os.SEEK_HOLE)
+        copied += copy_range(src_fd, dst_fd, data, hole - data)
+        offset = hole
+
+    os.ftruncate(dst_fd, size)
+
+    return copied
+
+
+def copy_range(src_fd, dst_fd, offset, length):
+    """
+    Copy {length} bytes at {offset} between two files, in kernel if possible
+    """
+
+    copied = 0
+
+    while copied < length:
+        pos = offset + copied
+
+        try:
+            done = os.copy_file_range(src_fd, dst_fd, length - copied, pos, pos)
+        except (AttributeError, OSError) as exc:
+            if isinstance(exc, OSError) and exc.errno not in fallback_errnos:
+                raise
+
+            chunk = os.pread(src_fd, min(length - copied, 1 << 20), pos)
+            done = os.pwrite(dst_fd, chunk, pos) if chunk else 0
+
+        if done == 0:
+            break
+
+        copied += done
+
+    return copied
+
+
+def is_sparse(st):
+    """
+    Check if a file allocates less blocks than its size needs
+    """
+
+    return hasattr(os, "SEEK_DATA") and st.st_blocks * 512 < st.st_size
+
+
+def copy_data(src, dst):
+    """
+    Copy file content with the cheapest method available: reflink (FICLONE),
+    then extents only for sparse files, then copy_file_range, then sendfile,
+    then a buffered copy
+    Return (method used, bytes copied)
+    """
+
+    # Opening a named pipe would block, shutil refuses them the same way
+    if not stat.S_ISREG(os.stat(src).st_mode):
+        raise shutil.SpecialFileError(f"'{src}' is not a regular file")
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        src_fd = fsrc.fileno()
+        dst_fd = fdst.fileno()
+        st = os.fstat(src_fd)
+
+        try:
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+            return "reflink", 0
+        except OSError:
+            pass
+
+        if is_sparse(st):
+            try:
+                return "sparse", copy_extents(src_fd, dst_fd, st.st_size)
+            except OSError as exc:
+                if exc.errno not in fallback_errnos + [errno.ENXIO]:
+                    raise
+
+                os.ftruncate(dst_fd, 0)
+
+        for method, copy_chunk in kernel_copies:
+            copied = 0
+
+            try:
+                while True:
+                    done = copy_chunk(src_fd, dst_fd, copy_chunk_size)
+
+                    if done == 0:
+                        return method, copied
+
+                    copied += done
+            except OSError as exc:
+                if exc.errno not in fallback_errnos:
+                    raise
+
+                os.lseek(src_fd, 0, os.SEEK_SET)
+                os.lseek(dst_fd, 0, os.SEEK_SET)
+                os.ftruncate(dst_fd, 0)
+
+        shutil.copyfileobj(fsrc, fdst, copy_chunk_size)
+
+    return "buffered", st.st_size
+
+
+def copy_file(src, dst, report=None):
+    """
+    Copy a file content, permissions and times like shutil.copy2, through
+    the cheapest copy method, counted in {report} with bytes copied
+    Return method used
+    """
+
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+
+    method, copied = copy_data(src, dst)
+    src_st = os.stat(src)
+    os.chmod(dst, stat.S_IMODE(src_st.st_mode))
+    os.utime(dst, ns=(src_st.st_atime_ns, src_st.st_mtime_ns))
+    count(report, method)
+    count(report, "bytes", copied)
+
+    return method
+
+
+def overwrite(src, tgt, report=None, sync=False, checksum=False, keep=None,
+        owner=None, group=None, progress=None):
     """
     Overwrite file or folder
+    With {sync}, only what differs is written (see sync_tree())
+    Files copied are recorded in {progress}, a Progress, if any
     """
 
+    if sync:
+        return sync_tree(src, tgt, checksum, keep, report, owner, group,
+                progress) is not None
+
+    progress = progress or Progress()
+
+    def copy_one(src_file, tgt_file):
+        try:
+            copy_file(src_file, tgt_file, report)
+        except OSError:
+            progress.add(src_file, failed=True)
+            raise
+
+        progress.add(src_file, os.path.getsize(src_file))
+
     if os.path.isdir(src):
         if os.path.isdir(tgt):
             shutil.rmtree(tgt)
 
         try:
-            shutil.copytree(src, tgt, symlinks=True)
+            shutil.copytree(src, tgt, symlinks=True, copy_function=copy_one)
         except EnvironmentError:
             return False
     else:
-        if os.path.exists(tgt):
+        if os.path.lexists(tgt):
             os.remove(tgt)
 
         try:
-            shutil.copy(src, tgt, follow_symlinks=False)
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), tgt)
+            else:
+                copy_one(src, tgt)
         except EnvironmentError:
             return False
 
     return True
 
 
-def rcopy(src, tgt):
+def file_hash(path, dir_fd=None):
     """
-    Recursive copy
+    Return BLAKE2 digest of a file content
     """
 
-    for root, dirs, files in os.walk(src):
-        for item in files:
-            src_path = os.path.join(root, item)
-            dst_path = os.path.join(tgt, src_path.replace(f"{src}/", ""))
+    # Imported here as only checksum comparisons need it
+    import hashlib
+
+    digest = hashlib.blake2b()
+    fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW | os.O_CLOEXEC,
+            dir_fd=dir_fd)
+
+    try:
+        for chunk in iter(lambda: os.read(fd, 1 << 20), b""):
+            digest.update(chunk)
+    finally:
+        os.close(fd)
+
+    return digest.digest()
+
+
+def remove_any(path):
+    """
+    Remove a file, symlink or folder
+    """
+
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def sync_entry(src, src_st, dst, checksum=False, report=None):
+    """
+    Make {dst} like {src} if they differ, files being written to a temporary
+    file then renamed over {dst}, with {src} mtime
+    Return "added", "updated" or None if nothing was done
+    """
+
+    try:
+        dst_st = os.stat(dst, follow_symlinks=False)
+    except FileNotFoundError:
+        dst_st = None
+
+    action = "added" if dst_st is None else "updated"
+    same_type = dst_st is not None and \
+            stat.S_IFMT(dst_st.st_mode) == stat.S_IFMT(src_st.st_mode)
+
+    if stat.S_ISLNK(src_st.st_mode):
+        link = os.readlink(src)
+
+        if same_type and os.readlink(dst) == link:
+            return None
+
+        if dst_st is not None and stat.S_ISDIR(dst_st.st_mode):
+            remove_any(dst)
+
+        symlink_force(link, dst)
+    elif stat.S_ISDIR(src_st.st_mode):
+        if same_type:
+            return None
+
+        if dst_st is not None:
+            remove_any(dst)
+
+        os.makedirs(dst)
+        shutil.copymode(src, dst)
+    else:
+        if same_type and src_st.st_size == dst_st.st_size:
+            if checksum and file_hash(src) == file_hash(dst):
+                return None
+            elif not checksum and src_st.st_mtime_ns == dst_st.st_mtime_ns:
+                return None
+
+        tmp_fd, tmp = tempfile.mkstemp(prefix=f".{os.path.basename(dst)}.",
+                dir=os.path.dirname(dst) or ".")
+        os.close(tmp_fd)
+
+        try:
+            copy_file(src, tmp, report)
+
+            if dst_st is not None and stat.S_ISDIR(dst_st.st_mode):
+                remove_any(dst)
+
+            os.replace(tmp, dst)
+        except OSError:
+            os.remove(tmp)
+            raise
+
+    count(report, action)
+
+    return action
+
+
+def sync_tree(src, tgt, checksum=False, keep=None, report=None, owner=None,
+        group=None, progress=None):
+    """
+    Make {tgt} a copy of {src} writing only what differs, by size and mtime
+    or by content with {checksum}. Target entries missing from {src} are
+    removed last, unless their relative path is in {keep}
+    With {owner} or {group}, target entries are given to them in the same walk
+    Return [(action, relative path)] of changes, None if anything failed
+    """
+
+    copy = Copy(tgt, checksum, prune=True, keep=keep)
+    visitors = [copy]
+
+    if owner is not None or group is not None:
+        visitors.append(Chown(owner, group, tgt))
+
+    try:
+        success = walk(src, visitors, report=report, progress=progress)
+    finally:
+        merge_counters(report, visitors)
+
+    return copy.changes if success else None
+
+
+def scan_tree(src, onerror=None):
+    """
+    Walk a tree top-down without following symlinks
+    Yield (relative folder path, list of DirEntry), folders before their
+    content. Unreadable folders are passed to {onerror} and skipped
+    """
+
+    stack = [""]
+
+    while stack:
+        rel_dir = stack.pop()
+
+        try:
+            with os.scandir(os.path.join(src, rel_dir)) as it:
+                entries = list(it)
+        except OSError as exc:
+            if onerror is not None:
+                onerror(exc)
+
+            continue
+
+        yield rel_dir, entries
+
+        for entry in reversed(entries):
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(os.path.join(rel_dir, entry.name))
+
+
+def walk_sources(sources, onerror):
+    """
+    Yield (path, lstat) of {sources} and everything below them, without
+    following symlinks. Paths that cannot be read are passed to {onerror}
+    with the error message
+    """
+
+    for source in sources:
+        try:
+            st = os.stat(source, follow_symlinks=False)
+        except OSError as exc:
+            onerror(source, exc.strerror)
+            continue
+
+        yield source, st
+
+        if not stat.S_ISDIR(st.st_mode):
+            continue
+
+        for folder, dirs, files in os.walk(source, onerror=lambda exc:
+                onerror(exc.filename, exc.strerror)):
+            for name in dirs + files:
+                path = os.path.join(folder, name)
 
-            if os.path.exists(dst_path):
-                if os.stat(src_path).st_mtime > os.stat(dst_path).st_mtime:
-                    shutil.copy(src_path, dst_path)
-            else:
                 try:
-                    shutil.copy(src_path, dst_path)
-                except EnvironmentError:
-                    return False
+                    yield path, os.stat(path, follow_symlinks=False)
+                except OSError as exc:
+                    onerror(path, exc.strerror)
+
+
+def copy_entry(src_entry, dst_path, report=None):
+    """
+    Copy one file or symlink, return True on success
+    """
+
+    try:
+        if src_entry.is_symlink():
+            if os.path.lexists(dst_path):
+                os.remove(dst_path)
+
+            os.symlink(os.readlink(src_entry.path), dst_path)
+            count(report, "symlink")
+        else:
+            copy_file(src_entry.path, dst_path, report)
+    except OSError:
+        count(report, "errors")
+        return False
+
+    return True
+
+
+def open_manifest(path):
+    """
+    Open (or create) an incremental copy manifest database
+    A corrupted manifest is set aside as '{path}.corrupt' and started again
+    Return None if it cannot be opened at all, locked or unreadable
+    manifests raising sqlite3.OperationalError
+    """
+
+    # Imported here as only incremental copies need it
+    import sqlite3
+
+    for _ in range(2):
+        try:
+            conn = sqlite3.connect(path)
+        except sqlite3.Error as exc:
+            print(f"{error} Cannot open manifest '{path}': {exc}")
+            return None
+
+        try:
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY "
+                    "KEY, mtime_ns INTEGER) WITHOUT ROWID")
+            conn.execute("CREATE TABLE IF NOT EXISTS files (dir TEXT, name "
+                    "TEXT, size INTEGER, mtime_ns INTEGER, ino INTEGER, "
+                    "PRIMARY KEY (dir, name)) WITHOUT ROWID")
+            conn.execute("SELECT count(*) FROM dirs").fetchone()
+
+            return conn
+        except sqlite3.OperationalError:
+            conn.close()
+            raise
+        except sqlite3.DatabaseError as exc:
+            conn.close()
+
+            if not os.path.exists(path):
+                raise
+
+            print(f"{warning} Manifest '{path}' unusable ({exc}), rebuilding it")
+            os.replace(path, f"{path}.corrupt")
+
+    return None
+
+
+def manifest_dir(conn, rel_dir):
+    """
+    Return recorded (folder mtime, {name: (size, mtime_ns, inode)})
+    """
+
+    row = conn.execute("SELECT mtime_ns FROM dirs WHERE path=?",
+            (rel_dir,)).fetchone()
+    files = conn.execute("SELECT name, size, mtime_ns, ino FROM files "
+            "WHERE dir=?", (rel_dir,))
+
+    return row[0] if row else None, {f[0]: tuple(f[1:]) for f in files}
+
+
+def rcopy(src, tgt, jobs=None, report=None, manifest=None, progress=None):
+    """
+    Recursive copy of files missing or older in target
+    Folders are created while walking, files are copied by a pool of {jobs}
+    threads, copy methods used are counted in {report}
+    With a {manifest} file, files whose size, mtime and inode did not change
+    since the previous run are skipped without looking at the target, which
+    is then expected not to be modified by anything else
+    Files copied or skipped are recorded in {progress}, a Progress, if any
+    """
+
+    # Imported here as it costs more than the rest of the module
+    import concurrent.futures
+
+    jobs = jobs or copy_jobs
+    progress = progress or Progress()
+    failures = []
+    in_flight = threading.BoundedSemaphore(jobs * 4)
+    conn = open_manifest(manifest) if manifest else None
+    done_rows = collections.deque()
+    visited = set()
+
+    def copied(row, future):
+        in_flight.release()
+        progress.add(os.path.join(src, row[0], row[1]), row[2],
+                not future.result())
+
+        if future.result():
+            done_rows.append(row)
+        else:
+            failures.append(row)
+
+    def list_target(tgt_dir):
+        os.makedirs(tgt_dir, exist_ok=True)
 
-        for item in dirs:
-            src_path = os.path.join(root, item)
-            dst_path = os.path.join(tgt, src_path.replace(f"{src}/", ""))
+        with os.scandir(tgt_dir) as it:
+            return {entry.name: entry for entry in it}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        for rel_dir, entries in scan_tree(src, failures.append):
+            tgt_dir = os.path.join(tgt, rel_dir)
+            dir_start = time.monotonic()
+            dir_mtime = None
+            known_mtime, known = None, {}
+            existing = None
+
+            try:
+                if conn is not None:
+                    dir_mtime = os.stat(os.path.join(src, rel_dir)).st_mtime_ns
+                    known_mtime, known = manifest_dir(conn, rel_dir)
+                    visited.add(rel_dir)
+
+                if dir_mtime is None or dir_mtime != known_mtime:
+                    existing = list_target(tgt_dir)
+
+                    if conn is not None:
+                        conn.execute("DELETE FROM files WHERE dir=?", (rel_dir,))
+                        conn.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?)",
+                                (rel_dir, dir_mtime))
+            except OSError:
+                failures.append(tgt_dir)
+                continue
+
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    continue
 
-            if not os.path.exists(dst_path):
                 try:
-                    os.makedirs(dst_path)
+                    st = entry.stat(follow_symlinks=False)
+                    row = (rel_dir, entry.name, st.st_size, st.st_mtime_ns,
+                            entry.inode())
+
+                    if known.get(entry.name) == row[2:]:
+                        if existing is not None:
+                            done_rows.append(row)
+
+                        progress.add(entry.path, st.st_size)
+                        continue
+
+                    if existing is None:
+                        existing = list_target(tgt_dir)
+
+                    dst_entry = existing.get(entry.name)
+
+                    if dst_entry is not None and st.st_mtime <= \
+                            dst_entry.stat(follow_symlinks=False).st_mtime:
+                        done_rows.append(row)
+                        progress.add(entry.path, st.st_size)
+                        continue
                 except OSError:
-                    return False
+                    failures.append(entry.path)
+                    progress.add(entry.path, failed=True)
+                    continue
 
-    return True
+                in_flight.acquire()
+                future = pool.submit(copy_entry, entry,
+                        os.path.join(tgt_dir, entry.name), report)
+                future.add_done_callback(functools.partial(copied, row))
+
+            progress.add_dir(os.path.join(src, rel_dir) if rel_dir else src,
+                    time.monotonic() - dir_start, len(entries))
+
+            if conn is not None:
+                flush_manifest(conn, done_rows)
+
+    if conn is not None:
+        flush_manifest(conn, done_rows)
+
+        if not failures:
+            stale = [(d,) for (d,) in conn.execute("SELECT path FROM dirs")
+                    if d not in visited]
+            conn.executemany("DELETE FROM dirs WHERE path=?", stale)
+            conn.executemany("DELETE FROM files WHERE dir=?", stale)
+
+        conn.commit()
+        conn.close()
+
+    return not failures
+
+
+def flush_manifest(conn, done_rows):
+    """
+    Record copied or verified files in manifest
+    """
+
+    rows = []
+
+    while done_rows:
+        rows.append(done_rows.popleft())
+
+    conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def resolve_ids(owner=None, group=None):
+    """
+    Return (uid, gid) of user and group names or ids, -1 for unchanged
+    """
+
+    uid = -1 if owner is None else owner
+    gid = -1 if group is None else group
+
+    if isinstance(owner, str):
+        try:
+            uid = pwd.getpwnam(owner).pw_uid
+        except KeyError:
+            raise LookupError(f"no such user: '{owner}'") from None
+
+    if isinstance(group, str):
+        try:
+            gid = grp.getgrnam(group).gr_gid
+        except KeyError:
+            raise LookupError(f"no such group: '{group}'") from None
+
+    return uid, gid
+
+
+class Visitor:
+    """
+    Base of walk() visitors, acting on walked entries or, with {tgt}, on the
+    same relative paths below {tgt}
+    """
+
+    name = "visitor"
+
+    def __init__(self, tgt=None):
+        self.tgt = tgt
+        self.root = None
+        self.counters = {"errors": 0, "time": 0.0}
+
+    def start(self, root):
+        self.root = root
+
+    def source(self, rel_path):
+        return os.path.join(self.root, rel_path) if rel_path else self.root
+
+    def target(self, rel_path):
+        return os.path.join(self.tgt, rel_path) if rel_path else self.tgt
+
+    def visit(self, dir_fd, name, st, rel_path):
+        pass
+
+    def finish(self, complete):
+        pass
+
+
+class Copy(Visitor):
+    """
+    Copy walked entries to {tgt} when they differ (see sync_entry())
+    With {prune}, target entries missing from walked tree are removed once the
+    whole tree was walked without error, unless their path is in {keep}
+    """
+
+    name = "copy"
+
+    def __init__(self, tgt, checksum=False, prune=False, keep=None):
+        super().__init__(tgt)
+        self.checksum = checksum
+        self.prune = prune
+        self.keep = keep or []
+        self.changes = []
+        self.seen = {}
+
+    def visit(self, dir_fd, name, st, rel_path):
+        if rel_path:
+            self.seen.setdefault(os.path.dirname(rel_path), set()).add(name)
+
+        action = sync_entry(self.source(rel_path), st, self.target(rel_path),
+                self.checksum, self.counters)
+
+        if action:
+            self.changes.append((action, rel_path or "."))
+
+        if stat.S_ISDIR(st.st_mode):
+            self.seen.setdefault(rel_path, set())
+
+    def finish(self, complete):
+        if not self.prune or not complete or self.counters["errors"]:
+            return
+
+        for rel_dir, names in sorted(self.seen.items()):
+            try:
+                stale = sorted(set(os.listdir(self.target(rel_dir))) - names)
+            except OSError:
+                count(self.counters, "errors")
+                continue
+
+            for name in stale:
+                rel_path = os.path.join(rel_dir, name)
+
+                if rel_path in self.keep:
+                    continue
+
+                try:
+                    remove_any(self.target(rel_path))
+                    count(self.counters, "removed")
+                    self.changes.append(("removed", rel_path))
+                except OSError:
+                    count(self.counters, "errors")
+
+
+class Chown(Visitor):
+    """
+    Give entries to {owner} and {group} (names or ids, None for unchanged),
+    symlinks themselves, leaving untouched entries already owned as wanted
+    """
+
+    name = "chown"
+
+    def __init__(self, owner=None, group=None, tgt=None):
+        super().__init__(tgt)
+        self.uid, self.gid = resolve_ids(owner, group)
+
+    def visit(self, dir_fd, name, st, rel_path):
+        if self.tgt is not None:
+            dir_fd, name = None, self.target(rel_path)
+            st = os.stat(name, follow_symlinks=False)
+
+        if self.uid in [-1, st.st_uid] and self.gid in [-1, st.st_gid]:
+            count(self.counters, "unchanged")
+        else:
+            os.chown(name, self.uid, self.gid, dir_fd=dir_fd,
+                    follow_symlinks=False)
+            count(self.counters, "changed")
+
+
+class Chmod(Visitor):
+    """
+    Set {perm} mode, or {dir_perm} for folders if given, leaving symlinks and
+    entries already having wanted mode untouched
+    """
+
+    name = "chmod"
+
+    def __init__(self, perm, dir_perm=None, tgt=None):
+        super().__init__(tgt)
+        self.perm = perm
+        self.dir_perm = dir_perm
+
+    def visit(self, dir_fd, name, st, rel_path):
+        if self.tgt is not None:
+            dir_fd, name = None, self.target(rel_path)
+            st = os.stat(name, follow_symlinks=False)
+
+        if stat.S_ISLNK(st.st_mode):
+            return
+
+        mode = self.perm
+
+        if self.dir_perm is not None and stat.S_ISDIR(st.st_mode):
+            mode = self.dir_perm
+
+        if stat.S_IMODE(st.st_mode) == mode:
+            count(self.counters, "unchanged")
+        else:
+            os.chmod(name, mode, dir_fd=dir_fd)
+            count(self.counters, "changed")
+
+
+class Hash(Visitor):
+    """
+    Collect BLAKE2 digests of regular files in 'digests' by relative path
+    """
+
+    name = "hash"
+
+    def __init__(self):
+        super().__init__()
+        self.digests = {}
+
+    def visit(self, dir_fd, name, st, rel_path):
+        if stat.S_ISREG(st.st_mode):
+            self.digests[rel_path or "."] = file_hash(name, dir_fd)
+            count(self.counters, "bytes", st.st_size)
+
+
+class Count(Visitor):
+    """
+    Count files, folders, symlinks and file bytes
+    """
+
+    name = "count"
+
+    def visit(self, dir_fd, name, st, rel_path):
+        if stat.S_ISDIR(st.st_mode):
+            count(self.counters, "dirs")
+        elif stat.S_ISLNK(st.st_mode):
+            count(self.counters, "symlinks")
+        else:
+            count(self.counters, "files")
+            count(self.counters, "bytes", st.st_size)
+
+
+def visit_all(root, visitors, progress):
+    """
+    Return a function applying every visitor to an entry, in order, timing
+    them and counting their errors, then recording files below {root} in
+    {progress}
+    """
+
+    def visit(dir_fd, name, st, rel_path):
+        failed = False
+
+        for visitor in visitors:
+            start = time.perf_counter()
+
+            try:
+                visitor.visit(dir_fd, name, st, rel_path)
+            except OSError:
+                count(visitor.counters, "errors")
+                failed = True
+
+            count(visitor.counters, "time", time.perf_counter() - start)
+
+        if not stat.S_ISDIR(st.st_mode):
+            progress.add(os.path.join(root, rel_path) if rel_path else root,
+                    st.st_size if stat.S_ISREG(st.st_mode) else 0, failed)
+
+    return visit
+
+
+def visit_entries(dir_fd, root, rel_dir, visit, report, progress):
+    """
+    Visit entries of an open folder, return names of its subfolders
+    """
+
+    subdirs = []
+    start = time.monotonic()
+    entries = 0
+
+    with os.scandir(dir_fd) as it:
+        for entry in it:
+            entries += 1
+
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                count(report, "errors")
+                continue
+
+            visit(dir_fd, entry.name, st, os.path.join(rel_dir, entry.name))
+
+            if stat.S_ISDIR(st.st_mode):
+                subdirs.append(entry.name)
+
+    progress.add_dir(os.path.join(root, rel_dir) if rel_dir else root,
+            time.monotonic() - start, entries)
+
+    return subdirs
+
+
+def visit_subtree(dir_fd, name, root, rel_dir, visit, report, progress):
+    """
+    Visit everything below subfolder {name} of {dir_fd}, descending through
+    folder fds, never following symlinks
+    """
+
+    try:
+        fd = os.open(name, subdir_flags, dir_fd=dir_fd)
+    except OSError:
+        count(report, "errors")
+        return
+
+    try:
+        for subdir in visit_entries(fd, root, rel_dir, visit, report,
+                progress):
+            visit_subtree(fd, subdir, root, os.path.join(rel_dir, subdir),
+                    visit, report, progress)
+    except OSError:
+        count(report, "errors")
+    finally:
+        os.close(fd)
 
 
-def rchown(path, new_owner=None, new_group=None):
+def walk(path, visitors, jobs=1, report=None, progress=None):
     """
-    Recursive chown
+    Walk {path} once, top-down, applying every visitor to each entry
+    Top level subfolders are shared between {jobs} threads
+    Unreadable folders are counted as 'errors' in {report}, visitors keep
+    their own counters, 'time' being seconds spent in them
+    Files and folders gone through are recorded in {progress}, if any
+    Return True if no error occurred
     """
 
-    shutil.chown(path, new_owner, new_group)
+    report = {} if report is None else report
+    errors = report.get("errors", 0)
+    progress = progress or Progress()
+    visit = visit_all(path, visitors, progress)
+
+    for visitor in visitors:
+        visitor.start(path)
+
+    try:
+        st = os.stat(path, follow_symlinks=False)
+        visit(None, path, st, "")
+
+        if stat.S_ISDIR(st.st_mode):
+            fd = os.open(path, subdir_flags)
+        else:
+            fd = None
+    except OSError:
+        count(report, "errors")
+        fd = None
+
+    if fd is not None:
+        try:
+            subdirs = visit_entries(fd, path, "", visit, report, progress)
+
+            if jobs > 1 and len(subdirs) > 1:
+                # Imported here as it costs more than the rest of the module
+                import concurrent.futures
+
+                with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+                    futures = [pool.submit(visit_subtree, fd, subdir, path,
+                        subdir, visit, report, progress) for subdir in subdirs]
+
+                # Other failures than OSError reach the caller as with one job
+                for future in futures:
+                    future.result()
+            else:
+                for subdir in subdirs:
+                    visit_subtree(fd, subdir, path, subdir, visit, report,
+                            progress)
+        except OSError:
+            count(report, "errors")
+        finally:
+            os.close(fd)
+
+    complete = report.get("errors", 0) == errors
+
+    for visitor in visitors:
+        start = time.perf_counter()
+        visitor.finish(complete)
+        count(visitor.counters, "time", time.perf_counter() - start)
 
-    for dirpath, dirs, files in os.walk(path):
-        for my_dir in dirs:
-            shutil.chown(os.path.join(dirpath, my_dir), new_owner, new_group)
+    return complete and not any(v.counters["errors"] for v in visitors)
+
+
+def merge_counters(report, visitors):
+    """
+    Add visitors counters, but time, to {report}
+    """
 
-        for my_file in files:
-            shutil.chown(os.path.join(dirpath, my_file), new_owner, new_group)
+    for visitor in visitors:
+        for key, value in visitor.counters.items():
+            if key != "time":
+                count(report, key, value)
 
 
-def rchmod(path, perm):
+def rchown(path, new_owner=None, new_group=None, jobs=1, report=None):
     """
-    Recursive chmod
+    Recursive chown, user and group resolved once, symlinks changed themselves
+    Entries already owned as wanted are left untouched
     """
 
-    os.chmod(path, perm)
+    visitors = [Chown(new_owner, new_group)]
+    success = walk(path, visitors, jobs, report)
+    merge_counters(report, visitors)
+
+    return success
+
+
+def rchmod(path, perm, dir_perm=None, jobs=1, report=None):
+    """
+    Recursive chmod, with {dir_perm} for folders if given
+    Symlinks and entries already having wanted mode are left untouched
+    """
 
-    for root, dirs, files in os.walk(path):
-        for my_dir in dirs:
-            os.chmod(os.path.join(root, my_dir), perm)
+    visitors = [Chmod(perm, dir_perm)]
+    success = walk(path, visitors, jobs, report)
+    merge_counters(report, visitors)
 
-        for my_file in files:
-            os.chmod(os.path.join(root, my_file), perm)
+    return success
@@ -2,6 +2,9 @@
 
 import os
 import subprocess
+import sys
+
+from . import run
 
 __description__ = "Git functions module"
 __author__ = "Choops <choopsbd@gmail.com>"
@@ -23,14 +26,15 @@ def update(url, folder):
     """
 
     if os.path.isdir(folder):
-        os.chdir(folder)
-        pull_cmd = ["git", "pull", "-q", "--no-rebase"]
-
-        subprocess.check_output(pull_cmd)
+        git_cmd = ["git", "-C", folder, "pull", "-q", "--no-rebase"]
     else:
-        clone_cmd = ["git", "clone", "-q", url, folder]
+        git_cmd = ["git", "clone", "-q", url, folder]
+
+    result = run.run(git_cmd, capture=True)
 
-        subprocess.check_output(clone_cmd)
+    if result.status != 0:
+        raise subprocess.CalledProcessError(result.status, git_cmd,
+                result.stdout, result.stderr)
 
 
 def stat_repo(path):
@@ -38,22 +42,26 @@ def stat_repo(path):
     Return git repo status
     """
 
-    os.chdir(path)
-    awk_cmd = "'/^Date:/ {print $2 \" \" $3 \" \" $4 \" \" $6 \" \" $5}'"
-    lc_cmd = f"git show | awk {awk_cmd}"
+    color = "always" if sys.stdout.isatty() else "never"
+    git_cmd = ["git", "-C", path, "-c", f"color.status={color}"]
 
-    last_commit = os.popen(lc_cmd).read().strip("\n")
-    commit_count = os.popen("git rev-list --all --count").read().strip("\n")
+    last_commit, commit_count, chk = [r.stdout.strip("\n") for r in
+            run.run_many([git_cmd + ["log", "-1", "--format=%ad"],
+                git_cmd + ["rev-list", "--all", "--count"],
+                git_cmd + ["status", "-s"]], capture=True, timeout=30)]
 
-    print(f"{ci}Last commit{c0}: {last_commit} ({commit_count})")
+    date = last_commit.split()
+
+    if len(date) >= 5:
+        last_commit = " ".join(date[0:3] + [date[4], date[3]])
 
-    chk = os.popen("git status -s").read()
+    print(f"{ci}Last commit{c0}: {last_commit} ({commit_count})")
 
     if chk == "":
         print(f"{cok}Up to date{c0}")
     else:
         print(f"{cw}Uncommited changes{c0}:")
-        os.system("git status -s")
+        print(chk)
 
     print()
 
@@ -1,9 +1,18 @@
 #!/usr/bin/env python3
 
+import contextlib
+import fnmatch
+import json
 import os
+import shlex
 import shutil
+import socket
+import time
 
+from . import agent
+from . import aptlists
 from . import file
+from . import run
 from . import syst
 from . import user
 from .base import yesno
@@ -22,6 +31,121 @@ done = f"{cok}OK{c0}:"
 warning = f"{cw}W{c0}:"
 
 
+def journal_path():
+    """
+    Return commands journal path: system log as root, user cache otherwise
+    """
+
+    if "TOOLZ_JOURNAL" in os.environ:
+        return os.environ["TOOLZ_JOURNAL"]
+
+    if os.getuid() == 0:
+        return "/var/log/toolz/pkg.jsonl"
+
+    cache_home = os.environ.get("XDG_CACHE_HOME",
+            os.path.expanduser("~/.cache"))
+
+    return f"{cache_home}/toolz/pkg.jsonl"
+
+
+def journalize(entry):
+    """
+    Append a command record to the journal, never failing the caller
+    """
+
+    path = journal_path()
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "a") as f:
+            f.write(f"{json.dumps(entry)}\n")
+    except OSError as exc:
+        print(f"{warning} Can not write journal '{path}': {exc}")
+
+
+def run_cmd(cmd, op, quiet_errors=False):
+    """
+    Run a package management command, recording its argv, start time, wall
+    and CPU times and exit status in the journal
+    Return exit status
+    """
+
+    result = run.run(shlex.split(cmd), quiet_errors=quiet_errors)
+
+    journalize({
+            "host": socket.gethostname(),
+            "op": op,
+            "argv": result.argv,
+            "start": round(result.start, 3),
+            "wall": round(result.wall, 3),
+            "cpu": round(result.cpu, 3),
+            "status": result.status
+            })
+
+    if result.status != 0 and not quiet_errors:
+        print(f"{warning} '{cmd}' exited with status {result.status}")
+
+    return result.status
+
+
+def report(path=None, since=0):
+    """
+    Summarize journal per operation: count, failures, wall and CPU times
+    Return {op: summary}
+    """
+
+    path = path or journal_path()
+    summary = {}
+
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+
+                if entry.get("start", 0) < since:
+                    continue
+
+                op_sum = summary.setdefault(entry["op"], {"count": 0,
+                    "failed": 0, "wall": 0.0, "cpu": 0.0, "max_wall": 0.0})
+                op_sum["count"] += 1
+                op_sum["failed"] += entry["status"] != 0
+                op_sum["wall"] += entry["wall"]
+                op_sum["cpu"] += entry["cpu"]
+                op_sum["max_wall"] = max(op_sum["max_wall"], entry["wall"])
+    except FileNotFoundError:
+        print(f"{warning} No journal in '{path}'")
+        return summary
+
+    print(f"{ci}Operation     Count  Failed     Wall(s)      CPU(s)  Max(s){c0}")
+
+    for op, op_sum in sorted(summary.items(), key=lambda i: -i[1]["wall"]):
+        cf = ce if op_sum["failed"] else c0
+        print(f"{op:<12} {op_sum['count']:>6}  {cf}{op_sum['failed']:>6}{c0}"
+              f"  {op_sum['wall']:>10.1f}  {op_sum['cpu']:>10.1f}"
+              f"  {op_sum['max_wall']:>6.1f}")
+
+    return summary
+
+
+def check_backend():
+    """
+    Make sure package commands suit the distribution, on first command only
+    """
+
+    if _backend["distro"] is None:
+        distro = syst.get_distro()
+
+        if distro not in debian_derivatives:
+            print(f"{error} Unsupported distribution '{distro}'")
+            exit(1)
+
+        _backend["distro"] = distro
+
+
 def update_sourceslist(distro):
     """
     Add contrib and non-free branches to Debian repos
@@ -48,51 +172,331 @@ def update_sourceslist(distro):
                     newf.write(f"{line.strip()}{line_end}\n")
 
 
+def set_admindir(path, lists=None):
+    """
+    Read package state from an alternate dpkg administrative folder, like
+    'dpkg --admindir', and optionally from an alternate apt lists folder
+    Only state queries are affected, not apt commands
+    """
+
+    global admindir, dpkg_status, lists_dir
+
+    admindir = path
+    dpkg_status = f"{admindir}/status"
+
+    if lists:
+        lists_dir = lists
+
+    _status_cache.update({"stamp": None, "index": {}, "sets": None})
+
+
+def status_index():
+    """
+    Return installed packages state from dpkg status file as
+    {package: {architecture: (want, flag, state)}}
+    Parsed once and kept until the status file changes
+    """
+
+    try:
+        st = os.stat(dpkg_status)
+    except OSError:
+        return {}
+
+    stamp = (st.st_mtime_ns, st.st_size)
+
+    if _status_cache["stamp"] != stamp:
+        _status_cache["index"] = parse_status(dpkg_status)
+        _status_cache["stamp"] = stamp
+        _status_cache["sets"] = None
+
+    return _status_cache["index"]
+
+
+def parse_status(status_file):
+    """
+    Parse a dpkg status file
+    """
+
+    index = {}
+    name = arch = ""
+    state = None
+
+    with open(status_file, "r", errors="replace") as f:
+        for line in f:
+            if line == "\n":
+                if name and state:
+                    index.setdefault(name, {})[arch] = state
+
+                name = arch = ""
+                state = None
+            elif line.startswith("Package:"):
+                name = line[8:].strip()
+            elif line.startswith("Architecture:"):
+                arch = line[13:].strip()
+            elif line.startswith("Status:"):
+                state = tuple(line[7:].split())
+
+    if name and state:
+        index.setdefault(name, {})[arch] = state
+
+    return index
+
+
+def native_arch():
+    """
+    Return dpkg native architecture (the one dpkg itself is built for)
+    """
+
+    for arch in status_index().get("dpkg", {}):
+        return arch
+
+    return ""
+
+
+def pkgs_in_state(state):
+    """
+    List packages in a given dpkg state ('installed', 'config-files'...)
+    Foreign architecture packages are qualified as '{package}:{arch}'
+    """
+
+    native = native_arch()
+    pkgs = []
+
+    for name, archs in status_index().items():
+        for arch, pkg_state in archs.items():
+            if pkg_state[-1] == state:
+                if arch in [native, "all", ""]:
+                    pkgs.append(name)
+                else:
+                    pkgs.append(f"{name}:{arch}")
+
+    return pkgs
+
+
 def is_installed(pkg):
     """
     Check if a package is installed
     """
 
-    inst_pkgs = []
-    list_pkgs_cmd = f"dpkg -l | grep ^ii"
-    list_pkgs = os.popen(list_pkgs_cmd)
+    name, _, arch = pkg.partition(":")
+    archs = status_index().get(name, {})
 
-    for line in list_pkgs:
-        inst_pkg = line.split()[1]
+    if arch:
+        archs = {arch: archs[arch]} if arch in archs else {}
 
-        if inst_pkg.endswith(':amd64'):
-            inst_pkg = inst_pkg.replace(':amd64','')
+    return any(state[-1] == "installed" for state in archs.values())
 
-        inst_pkgs.append(inst_pkg)
 
-    return pkg in inst_pkgs
+def last_update():
+    """
+    Return timestamp of last known successful sources update
+    Lists mtimes come from servers' Last-Modified, so they can only make it
+    look older than it is
+    """
 
+    stamps = [0]
 
-def install(pkgs, force_yes=False):
+    for path in [update_stamp, lists_dir]:
+        try:
+            stamps.append(os.stat(path).st_mtime)
+        except OSError:
+            pass
+
+    try:
+        with os.scandir(lists_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name != "lock":
+                    stamps.append(entry.stat().st_mtime)
+    except OSError:
+        pass
+
+    return max(stamps)
+
+
+def last_sources_change():
     """
-    Install a list of packages
+    Return timestamp of last change in sources or architectures
+    """
+
+    stamps = [0]
+    sources_paths = [sources_file, sources_dir, f"{admindir}/arch"]
+
+    if os.path.isdir(sources_dir):
+        sources_paths += [f"{sources_dir}/{f}" for f in os.listdir(sources_dir)]
+
+    for path in sources_paths:
+        try:
+            stamps.append(os.stat(path).st_mtime)
+        except OSError:
+            pass
+
+    return max(stamps)
+
+
+def sources_are_fresh(ttl=None):
     """
+    Check if package lists were updated less than {ttl} seconds ago and
+    after the last sources modification
+    """
+
+    ttl = lists_ttl if ttl is None else ttl
+    updated = last_update()
+
+    return time.time() - updated < ttl and updated >= last_sources_change()
+
+
+def refresh_sources(force=False, ttl=None):
+    """
+    Update package lists unless they are fresh enough
+    """
+
+    if not force and sources_are_fresh(ttl):
+        return True
+
+    check_backend()
 
     high = "" if user.is_sudo() else "sudo "
-    force_yes_opt = " -y" if force_yes else ""
+
+    if run_cmd(f"{high}{src_update}", "update") != 0:
+        return False
+
+    try:
+        os.makedirs(os.path.dirname(update_stamp), exist_ok=True)
+
+        with open(update_stamp, "a"):
+            os.utime(update_stamp)
+    except OSError:
+        pass
+
+    return True
+
+
+@contextlib.contextmanager
+def transaction(force_yes=None):
+    """
+    Queue install/remove/purge calls and run them as the fewest possible apt
+    invocations when leaving the context
+    Without explicit {force_yes}, confirmation is skipped only if every
+    queued call skipped it
+    """
+
+    if _plan["active"]:
+        yield
+        return
+
+    _plan.update({"active": True, "ops": [], "force_yes": []})
+
+    try:
+        yield
+        ops = _plan["ops"]
+
+        if force_yes is None:
+            force_yes = all(_plan["force_yes"])
+    finally:
+        _plan.update({"active": False, "ops": [], "force_yes": []})
+
+    commit(ops, force_yes)
+
+
+def queue(action, pkgs, force_yes=False):
+    """
+    Register an operation ('install', 'remove', 'purge' or 'autoremove'),
+    run it at once if no transaction is open
+    """
+
+    if _plan["active"]:
+        _plan["ops"].append((action, list(pkgs)))
+        _plan["force_yes"].append(force_yes)
+    else:
+        commit([(action, list(pkgs))], force_yes)
+
+
+def plan(ops):
+    """
+    Fold operations into apt command lines (without privileges and options)
+    Later operations on a package override earlier ones, removal patterns
+    are expanded against known packages and unknown ones are dropped
+    """
+
+    actions = {}
+    autoremove = False
+    known = status_index()
+
+    for action, pkgs in ops:
+        if action == "autoremove":
+            autoremove = True
+            continue
+
+        for pkg in pkgs:
+            if not pkg:
+                continue
+
+            if action == "install":
+                targets = [pkg]
+            elif any(c in pkg for c in "*?["):
+                targets = fnmatch.filter(known, pkg)
+            else:
+                targets = [pkg] if pkg.split(":")[0] in known else []
+
+            for target in targets:
+                actions.pop(target, None)
+                actions[target] = action
+
+    installs = [p for p, a in actions.items() if a == "install"]
+    removes = [p for p, a in actions.items() if a == "remove"]
+    purges = [p for p, a in actions.items() if a == "purge"]
 
     cmds = []
-    cmds.append(f"{high}{src_update}")
-    cmds.append(f"{high}{pkg_install}{force_yes_opt} {' '.join(pkgs)}")
 
-    for cmd in cmds:
-        os.system(cmd)
+    if installs:
+        args = installs + [f"{p}-" for p in removes]
+        cmds.append(f"{pkg_install} {' '.join(args)}")
+    elif removes:
+        cmds.append(f"{pkg_remove} {' '.join(removes)}")
 
+    # apt has no suffix for purging within another command
+    if purges:
+        cmds.append(f"{pkg_purge} {' '.join(purges)}")
 
-def remove(pkgs, force_yes=False):
+    if autoremove:
+        cmds.append(unneeded_remove)
+
+    return cmds, bool(installs)
+
+
+def commit(ops, force_yes=False):
     """
-    Remove a list of packages
+    Run planned operations, updating sources first when installing
     """
 
     high = "" if user.is_sudo() else "sudo "
     force_yes_opt = " -y" if force_yes else ""
 
-    os.system(f"{high}{pkg_remove}{force_yes_opt} {' '.join(pkgs)}")
+    check_backend()
+
+    cmds, needs_sources = plan(ops)
+
+    if needs_sources:
+        refresh_sources()
+
+    for cmd in cmds:
+        run_cmd(f"{high}{cmd}{force_yes_opt}", cmd.split()[1])
+
+
+def install(pkgs, force_yes=False):
+    """
+    Install a list of packages
+    """
+
+    queue("install", pkgs, force_yes)
+
+
+def remove(pkgs, force_yes=False):
+    """
+    Remove a list of packages
+    """
+
+    queue("remove", pkgs, force_yes)
 
 
 def purge(pkgs, force_yes=False):
@@ -100,15 +504,32 @@ def purge(pkgs, force_yes=False):
     Purge a list of packages
     """
 
-    high = "" if user.is_sudo() else "sudo "
-    force_yes_opt = " -y" if force_yes else ""
+    queue("purge", pkgs, force_yes)
+    queue("autoremove", [], force_yes)
 
-    cmds = []
-    cmds.append(f"{high}{pkg_purge}{force_yes_opt} {' '.join(pkgs)}")
-    cmds.append(f"{high}{unneeded_remove}{force_yes_opt}")
 
-    for cmd in cmds:
-        os.system(cmd)
+def obsolete_pkgs():
+    """
+    List installed packages no archive provides anymore
+    """
+
+    available = aptlists.available_pkgs(lists_dir)
+
+    if not available:
+        return []
+
+    native = native_arch()
+    obs_pkgs = []
+
+    for name, archs in status_index().items():
+        for arch, state in archs.items():
+            if state[-1] == "installed" and (name, arch) not in available:
+                if arch in [native, "all", ""]:
+                    obs_pkgs.append(name)
+                else:
+                    obs_pkgs.append(f"{name}:{arch}")
+
+    return obs_pkgs
 
 
 def rm_obsoletes():
@@ -116,10 +537,7 @@ def rm_obsoletes():
     Remove obsolete packages
     """
 
-    awk_cmd = "'/\/now/ {print $1}'"
-    get_obs = f"apt list ?obsolete 2>/dev/null | awk  -F'/' {awk_cmd}"
-    obs_out = os.popen(get_obs).read()
-    obs_pkgs = [ pkg.split(":")[0] for pkg in obs_out.split("\n") ]
+    obs_pkgs = obsolete_pkgs()
 
     if obs_pkgs:
         purge(obs_pkgs)
@@ -131,26 +549,13 @@ def clean(force_yes=False):
     """
 
     high = "" if user.is_sudo() else "sudo "
-    force_yes_opt = " -y" if force_yes else ""
-
-    rc_pkgs = []
-    list_rc_pkgs_cmd = f"dpkg -l | grep ^rc"
-    list_rc_pkgs = os.popen(list_rc_pkgs_cmd)
-
-    for line in list_rc_pkgs:
-        rc_pkgs.append(line.split()[1])
-
-    cmds = []
 
-    if rc_pkgs != []:
-        cmds.append(f"{high}{pkg_purge}{force_yes_opt} {' '.join(rc_pkgs)}")
+    rc_pkgs = pkgs_in_state("config-files")
 
-    cmds.append(f"{high}{unneeded_remove}{force_yes_opt}")
-    cmds.append(f"{high}{src_soft_clean}")
-    cmds.append(f"{high}{src_clean}")
+    commit([("purge", rc_pkgs), ("autoremove", [])], force_yes)
 
-    for cmd in cmds:
-        os.system(cmd)
+    for cmd in [src_soft_clean, src_clean]:
+        run_cmd(f"{high}{cmd}", "clean", quiet_errors=True)
 
 
 def upgrade(force_yes=False):
@@ -158,64 +563,148 @@ def upgrade(force_yes=False):
     Upgrade distro
     """
 
+    check_backend()
+
     high = "" if user.is_sudo() else "sudo "
     force_yes_opt = " -y" if force_yes else ""
 
-    cmds = [f"{high}{src_update}", f"{high}{fullupgrade}{force_yes_opt}"]
+    refresh_sources()
 
-    for cmd in cmds:
-        os.system(cmd)
+    run_cmd(f"{high}{fullupgrade}{force_yes_opt}", "upgrade")
 
 
-def prerequisites(req_pkgs):
+def installed_pkgs():
     """
-    Install needed packages if not already installed
+    Return the set of installed packages, each one both as '{package}' and
+    '{package}:{arch}', and the subset of them on hold
+    Computed once per status index
     """
 
-    missing_pkgs = []
+    index = status_index()
 
-    for req_pkg in req_pkgs:
-        if not is_installed(req_pkg):
-            missing_pkgs.append(req_pkg)
+    if _status_cache["sets"] is not None:
+        return _status_cache["sets"]
 
-    if missing_pkgs:
-        print(f"{warning} Missing package(s): {', '.join(missing_pkgs)}")
-        p_count = "it"
+    installed = set()
+    held = set()
 
-        if len(missing_pkgs) > 1:
-            p_count = "them"
+    for name, archs in index.items():
+        for arch, state in archs.items():
+            if state[-1] == "installed":
+                installed.update([name, f"{name}:{arch}"])
 
-        if user.is_sudo():
-            if yesno(f"Install {p_count}"):
-                install(req_pkgs, True)
-            else:
-                exit(1)
+                if state[0] == "hold":
+                    held.update([name, f"{name}:{arch}"])
+
+    _status_cache["sets"] = (installed, held)
+
+    return installed, held
+
+
+def resolve(req_pkgs):
+    """
+    Sort a list of required packages in one pass against installed state
+    Return {"present": [...], "missing": [...], "held": [...]}
+    """
+
+    if admindir != default_admindir:
+        return compute_resolve(list(req_pkgs))
+
+    return agent.ask("resolve", compute_resolve, list(req_pkgs))
+
+
+def compute_resolve(req_pkgs):
+    """
+    Resolve required packages against the dpkg status index
+    """
+
+    installed, held = installed_pkgs()
+
+    report = {"present": [], "missing": [], "held": []}
+
+    for req_pkg in dict.fromkeys(req_pkgs):
+        if req_pkg not in installed:
+            report["missing"].append(req_pkg)
         else:
-            exit(1)
+            report["present"].append(req_pkg)
+
+            if req_pkg in held:
+                report["held"].append(req_pkg)
+
+    return report
+
+
+def installed_count():
+    """
+    Return number of installed packages
+    """
+
+    if admindir != default_admindir:
+        return compute_installed_count()
+
+    return agent.ask("installed_count", compute_installed_count)
+
+
+def compute_installed_count():
+    """
+    Count installed packages in the dpkg status index
+    """
+
+    return len(pkgs_in_state("installed"))
+
+
+def prerequisites(req_pkgs, strict=True):
+    """
+    Install needed packages if not already installed
+    Return resolution report, or exit if something stays missing in 'strict'
+    mode
+    """
+
+    report = resolve(req_pkgs)
+    missing_pkgs = report["missing"]
+
+    if not missing_pkgs:
+        return report
+
+    print(f"{warning} Missing package(s): {', '.join(missing_pkgs)}")
+    p_count = "it" if len(missing_pkgs) == 1 else "them"
+
+    if user.is_sudo() and yesno(f"Install {p_count}"):
+        install(missing_pkgs, True)
+
+        report = resolve(req_pkgs)
+
+    if report["missing"] and strict:
+        print(f"{error} Needed package not installed\n")
+        exit(1)
+
+    return report
+
+
+_status_cache = {"stamp": None, "index": {}, "sets": None}
+_plan = {"active": False, "ops": [], "force_yes": []}
 
-        for req_pkg in missing_pkgs:
-            if not is_installed(req_pkg):
-                print(f"{error} Needed package not installed\n")
-                exit(1)
+_backend = {"distro": None}
 
+debian_derivatives = ["debian", "raspbian", "ubuntu"]
 
-distro = syst.get_distro()
-debian_derivatives = ["debian", "ubuntu"]
+src_update = "apt update"
+src_soft_clean = "apt autoclean"
+src_clean = "apt clean"
 
-if distro in debian_derivatives:
-    src_update = "apt update"
-    src_soft_clean = "apt autoclean 2>/dev/null"
-    src_clean = "apt clean 2>/dev/null"
+fullupgrade = "apt full-upgrade"
+unneeded_remove = "apt autoremove --purge"
 
-    fullupgrade = "apt full-upgrade"
-    unneeded_remove = "apt autoremove --purge"
+pkg_install = "apt install"
+pkg_remove = "apt remove"
+pkg_purge = "apt purge"
 
-    pkg_install = "apt install"
-    pkg_remove = "apt remove"
-    pkg_purge = "apt purge"
+default_admindir = "/var/lib/dpkg"
+admindir = os.environ.get("DPKG_ADMINDIR", default_admindir)
+dpkg_status = f"{admindir}/status"
 
-    list_pkgs = "dpkg -l | grep ^ii"
-    list_residual_conf = f"dpkg -l | grep ^rc"
-else:
-    print(f"{error} Unsupported distribution '{distro}'")
-    exit(1)
+sources_file = "/etc/apt/sources.list"
+sources_dir = "/etc/apt/sources.list.d"
+lists_dir = "/var/lib/apt/lists"
+update_stamp = "/var/lib/apt/periodic/update-success-stamp"
+lists_ttl = int(os.environ.get("TOOLZ_APT_TTL", 3600))
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+import collections
+import os
+import selectors
+import signal
+import subprocess
+import time
+
+__description__ = "Command execution module"
+__author__ = "Choops <choopsbd@gmail.com>"
+
+c0 = "\33[0m"
+ce = "\33[31m"
+cok = "\33[32m"
+cw = "\33[33m"
+ci = "\33[36m"
+
+error = f"{ce}E{c0}:"
+done = f"{cok}OK{c0}:"
+warning = f"{cw}W{c0}:"
+
+Result = collections.namedtuple("Result", ["argv", "status", "stdout",
+    "stderr", "start", "wall", "cpu", "timed_out"])
+
+# Status of commands that could not be started or were killed on timeout,
+# as a shell would report them
+not_found = 127
+killed = -signal.SIGKILL
+
+history = collections.deque(maxlen=1000)
+max_jobs = 16
+
+
+def spawn(argv, capture, quiet_errors, cwd, env, stdin=None):
+    """
+    Start a command without shell, with posix_spawn when possible
+    Return (pid, {fd: stream name}, popen object or None)
+    """
+
+    outputs = {}
+    stdout = subprocess.PIPE if capture else None
+    stderr = subprocess.DEVNULL if quiet_errors else None
+
+    if capture and not quiet_errors:
+        stderr = subprocess.PIPE
+
+    if not hasattr(os, "posix_spawnp") or cwd is not None:
+        proc = subprocess.Popen(argv, stdin=stdin, stdout=stdout, stderr=stderr,
+                cwd=cwd, env=env)
+
+        for stream, name in [(proc.stdout, "stdout"), (proc.stderr, "stderr")]:
+            if stream is not None:
+                outputs[os.dup(stream.fileno())] = name
+                stream.close()
+
+        return proc.pid, outputs, proc
+
+    file_actions = []
+    child_fds = []
+
+    if stdin is not None:
+        file_actions.append((os.POSIX_SPAWN_DUP2, stdin, 0))
+
+    for target, wanted, name in [(1, stdout, "stdout"), (2, stderr, "stderr")]:
+        if wanted == subprocess.PIPE:
+            read_fd, write_fd = os.pipe()
+            file_actions.append((os.POSIX_SPAWN_DUP2, write_fd, target))
+            file_actions.append((os.POSIX_SPAWN_CLOSE, read_fd))
+            outputs[read_fd] = name
+            child_fds.append(write_fd)
+        elif wanted == subprocess.DEVNULL:
+            file_actions.append((os.POSIX_SPAWN_OPEN, target, os.devnull,
+                os.O_WRONLY, 0))
+
+    try:
+        pid = os.posix_spawnp(argv[0], argv, os.environ if env is None else env,
+                file_actions=file_actions)
+    except OSError:
+        for fd in outputs:
+            os.close(fd)
+        raise
+    finally:
+        for fd in child_fds:
+            os.close(fd)
+
+    return pid, outputs, None
+
+
+def wait(pid, outputs, timeout):
+    """
+    Collect outputs and wait for a process, killing it on timeout
+    Return (wait status, rusage, {stream name: bytes}, timed out)
+    """
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    chunks = {name: [] for name in outputs.values()}
+    timed_out = False
+
+    pidfd = None
+
+    if hasattr(os, "pidfd_open"):
+        try:
+            pidfd = os.pidfd_open(pid)
+        except OSError:
+            pidfd = None
+
+    open_fds = set(outputs)
+    exited = False
+
+    with selectors.DefaultSelector() as sel:
+        for fd in open_fds:
+            sel.register(fd, selectors.EVENT_READ)
+
+        if pidfd is not None:
+            sel.register(pidfd, selectors.EVENT_READ)
+
+        while not exited or open_fds:
+            remaining = None if deadline is None else deadline - time.monotonic()
+
+            if remaining is not None and remaining <= 0:
+                timed_out = True
+                break
+
+            # Without pidfd, process exit has to be polled
+            if pidfd is None and not exited:
+                remaining = 0.05 if remaining is None else min(remaining, 0.05)
+
+            for key, _ in sel.select(remaining):
+                if key.fd == pidfd:
+                    sel.unregister(pidfd)
+                    exited = True
+                    continue
+
+                data = os.read(key.fd, 65536)
+
+                if data:
+                    chunks[outputs[key.fd]].append(data)
+                else:
+                    sel.unregister(key.fd)
+                    open_fds.discard(key.fd)
+
+            if pidfd is None and not exited:
+                exited = os.waitid(os.P_PID, pid,
+                        os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+
+    if timed_out:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    _, status, rusage = os.wait4(pid, 0)
+
+    for fd in outputs:
+        os.close(fd)
+
+    if pidfd is not None:
+        os.close(pidfd)
+
+    return status, rusage, {n: b"".join(c) for n, c in chunks.items()}, \
+            timed_out
+
+
+def run(argv, capture=False, timeout=None, quiet_errors=False, cwd=None,
+        env=None, stdin=None):
+    """
+    Run a command given as an argument list, without shell
+    Its input is the {stdin} file descriptor if any, else inherited
+    Output is returned as text if {capture}, else left to the terminal
+    A command still running after {timeout} seconds is killed
+    Return a Result, also kept in 'history'
+    """
+
+    argv = [str(arg) for arg in argv]
+    start = time.time()
+    start_wall = time.perf_counter()
+
+    try:
+        pid, outputs, proc = spawn(argv, capture, quiet_errors, cwd, env,
+                stdin)
+    except OSError as exc:
+        if not quiet_errors:
+            print(f"{error} {argv[0]}: {exc.strerror}")
+
+        result = Result(argv, not_found, "", "", start,
+                time.perf_counter() - start_wall, 0.0, False)
+        history.append(result)
+
+        return result
+
+    wait_status, rusage, streams, timed_out = wait(pid, outputs, timeout)
+    status = killed if timed_out else os.waitstatus_to_exitcode(wait_status)
+
+    if proc is not None:
+        proc.returncode = status
+
+    if timed_out and not quiet_errors:
+        print(f"{warning} '{' '.join(argv)}' killed after {timeout}s")
+
+    result = Result(argv, status,
+            streams.get("stdout", b"").decode(errors="replace"),
+            streams.get("stderr", b"").decode(errors="replace"),
+            start, time.perf_counter() - start_wall,
+            rusage.ru_utime + rusage.ru_stime, timed_out)
+    history.append(result)
+
+    return result
+
+
+def status(argv, timeout=None):
+    """
+    Run a command quietly, return True if it succeeded
+    """
+
+    return run(argv, capture=True, timeout=timeout, quiet_errors=True).status == 0
+
+
+def output(argv, timeout=None):
+    """
+    Run a command quietly, return its standard output ("" on failure)
+    """
+
+    result = run(argv, capture=True, timeout=timeout, quiet_errors=True)
+
+    return result.stdout if result.status == 0 else ""
+
+
+def run_many(cmds, jobs=None, **kwargs):
+    """
+    Run independent commands concurrently, {jobs} at a time at most
+    (commands mostly wait, so by default all of them up to 'max_jobs')
+    Return Results in the same order as {cmds}
+    """
+
+    # Imported here as it costs more than the rest of the module
+    import concurrent.futures
+
+    jobs = jobs or min(len(cmds), max_jobs) or 1
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(lambda argv: run(argv, **kwargs), cmds))
+
+
+def stats(since=0):
+    """
+    Summarize recorded calls per command: count, failures, wall, CPU times
+    """
+
+    summary = {}
+
+    for result in history:
+        if result.start < since:
+            continue
+
+        cmd_sum = summary.setdefault(result.argv[0], {"count": 0, "failed": 0,
+            "wall": 0.0, "cpu": 0.0})
+        cmd_sum["count"] += 1
+        cmd_sum["failed"] += result.status != 0
+        cmd_sum["wall"] += result.wall
+        cmd_sum["cpu"] += result.cpu
+
+    return summary
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import stat
+import zlib
+
+from . import file
+
+__description__ = "Deduplicating content-addressed backup store module"
+__author__ = "Choops <choopsbd@gmail.com>"
+
+c0 = "\33[0m"
+ce = "\33[31m"
+cok = "\33[32m"
+cw = "\33[33m"
+ci = "\33[36m"
+
+error = f"{ce}E{c0}:"
+done = f"{cok}OK{c0}:"
+warning = f"{cw}W{c0}:"
+
+# Content-defined chunking: a chunk ends where a rolling hash of the last
+# bytes has its 'cut_mask' bits at zero, past 'chunk_min', so that inserting
+# data only changes the chunks around it. The gear hash is shifted right,
+# which keeps it bounded and makes it forget bytes older than ~40
+chunk_min = 16 << 10
+chunk_max = 128 << 10
+cut_mask = ((1 << 14) - 1) << 18
+gear = [int.from_bytes(hashlib.blake2b(bytes([i]), digest_size=4).digest(),
+    "big") for i in range(256)]
+read_size = 1 << 20
+
+digest_size = 20
+
+# Small files are sent to worker processes by batches
+batch_files = 64
+batch_bytes = 8 << 20
+
+
+def cut_point(buf, start):
+    """
+    Return end of the chunk of {buf} beginning at {start}
+    """
+
+    end = min(len(buf), start + chunk_max)
+    first = start + chunk_min
+
+    if end <= first:
+        return end
+
+    h = 0
+
+    # Hash is primed with the bytes preceding the first possible cut point
+    for i in range(first - 64, first):
+        h = (h >> 1) + gear[buf[i]]
+
+    for i in range(first, end):
+        h = (h >> 1) + gear[buf[i]]
+
+        if not h & cut_mask:
+            return i + 1
+
+    return end
+
+
+def split(f):
+    """
+    Yield content-defined chunks of a file object, reading it by blocks
+    """
+
+    buf = bytearray()
+    pos = 0
+    eof = False
+
+    while True:
+        if not eof and len(buf) - pos < chunk_max:
+            # Consumed bytes are dropped once per read, not once per chunk
+            del buf[:pos]
+            pos = 0
+
+            while not eof and len(buf) < chunk_max:
+                data = f.read(read_size)
+                eof = not data
+                buf += data
+
+        if pos == len(buf):
+            return
+
+        end = cut_point(buf, pos)
+        yield bytes(buf[pos:end])
+        pos = end
+
+
+def chunk_path(root, digest):
+    return f"{root}/chunks/{digest[:2]}/{digest[2:]}"
+
+
+def put_chunk(root, chunk):
+    """
+    Store a chunk under its BLAKE2 digest unless already there
+    Return (hex digest, bytes written)
+    """
+
+    digest = hashlib.blake2b(chunk, digest_size=digest_size).hexdigest()
+    path = chunk_path(root, digest)
+
+    if os.path.exists(path):
+        return digest, 0
+
+    packed = zlib.compress(chunk, 1)
+    data = b"z" + packed if len(packed) < len(chunk) else b"r" + chunk
+    tmp = f"{path}.{os.getpid()}.tmp"
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(tmp, "wb") as f:
+        f.write(data)
+
+    os.replace(tmp, path)
+
+    return digest, len(data)
+
+
+def get_chunk(root, digest):
+    with open(chunk_path(root, digest), "rb") as f:
+        data = f.read()
+
+    return zlib.decompress(data[1:]) if data[:1] == b"z" else data[1:]
+
+
+def store_files(root, paths):
+    """
+    Chunk files into the store (run by worker processes)
+    Return [(path, [digests] or None, bytes written, error message)]
+    """
+
+    results = []
+
+    for path in paths:
+        digests = []
+        written = 0
+
+        try:
+            with open(path, "rb") as f:
+                for chunk in split(f):
+                    digest, size = put_chunk(root, chunk)
+                    digests.append(digest)
+                    written += size
+        except OSError as exc:
+            results.append((path, None, written, exc.strerror))
+            continue
+
+        results.append((path, digests, written, ""))
+
+    return results
+
+
+def index_path(root, name):
+    return f"{root}/snapshots/{name}.idx"
+
+
+def snapshots(root):
+    """
+    List snapshots of a store, oldest first
+    """
+
+    try:
+        names = os.listdir(f"{root}/snapshots")
+    except FileNotFoundError:
+        return []
+
+    return sorted(name[:-4] for name in names if name.endswith(".idx"))
+
+
+def read_index(root, name):
+    """
+    Yield entries of a snapshot index, header first
+    """
+
+    with gzip.open(index_path(root, name), "rt") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def entry_of(path, st):
+    """
+    Return index entry of a path, without chunks
+    Return None for devices, sockets and pipes, which are not backed up
+    """
+
+    entry = {"p": path, "m": stat.S_IMODE(st.st_mode), "u": st.st_uid,
+            "g": st.st_gid, "t": st.st_mtime_ns}
+
+    if stat.S_ISDIR(st.st_mode):
+        entry["k"] = "d"
+    elif stat.S_ISLNK(st.st_mode):
+        entry["k"] = "l"
+        entry["l"] = os.readlink(path)
+    elif stat.S_ISREG(st.st_mode):
+        entry["k"] = "f"
+        entry["s"] = st.st_size
+    else:
+        return None
+
+    return entry
+
+
+def backup(root, name, sources, jobs=None, report=None, base=None,
+        progress=None):
+    """
+    Back up {sources} as snapshot {name} of store {root}: regular files are
+    chunked by {jobs} processes, files unchanged (size and mtime) since the
+    {base} snapshot (default: latest one) reuse its chunks without being read
+    Files backed up are recorded in {progress}, a toolz.file.Progress, if any
+    Return {path: error message} of files that could not be backed up
+    """
+
+    # Imported here as only backups need it
+    import concurrent.futures
+
+    report = {} if report is None else report
+    progress = progress or file.Progress()
+    errors = {}
+    previous = {}
+    base = base or (snapshots(root) or [None])[-1]
+
+    if base:
+        for entry in read_index(root, base):
+            if entry.get("k") == "f":
+                previous[entry["p"]] = entry
+
+    os.makedirs(f"{root}/snapshots", exist_ok=True)
+    tmp_index = f"{index_path(root, name)}.tmp"
+
+    def record(entry):
+        index.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        report["entries"] = report.get("entries", 0) + 1
+
+    def failed(path, message):
+        errors[path] = message
+        progress.add(path, failed=True)
+
+    def stored(entries, future):
+        for path, digests, written, message in future.result():
+            report["written"] = report.get("written", 0) + written
+
+            if digests is None:
+                failed(path, message)
+                continue
+
+            progress.add(path, entries[path]["s"])
+
+            entry = entries[path]
+            entry["c"] = digests
+            record(entry)
+
+    with gzip.open(tmp_index, "wt") as index, \
+            concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        record({"snapshot": name, "sources": sources, "created":
+            datetime.datetime.now().isoformat(timespec="seconds")})
+
+        futures = []
+        batch = {}
+        batch_size = 0
+
+        for path, st in file.walk_sources(sources, failed):
+            entry = entry_of(path, st)
+
+            if entry is None:
+                continue
+            elif entry["k"] != "f":
+                record(entry)
+                continue
+
+            report["bytes"] = report.get("bytes", 0) + entry["s"]
+            old = previous.get(path)
+
+            if old and old["s"] == entry["s"] and old["t"] == entry["t"]:
+                entry["c"] = old["c"]
+                record(entry)
+                progress.add(path, entry["s"])
+                continue
+
+            batch[path] = entry
+            batch_size += entry["s"]
+
+            if len(batch) >= batch_files or batch_size >= batch_bytes:
+                futures.append((batch, pool.submit(store_files, root,
+                    list(batch))))
+                batch = {}
+                batch_size = 0
+
+                # Results are indexed as they come, keeping memory bounded
+                while len(futures) > jobs_bound(jobs):
+                    stored(*futures.pop(0))
+
+        if batch:
+            futures.append((batch, pool.submit(store_files, root, list(batch))))
+
+        for entries, future in futures:
+            stored(entries, future)
+
+    os.replace(tmp_index, index_path(root, name))
+    report["errors"] = len(errors)
+
+    return errors
+
+
+def jobs_bound(jobs):
+    """
+    Return number of batches allowed in flight for {jobs} workers
+    """
+
+    return (jobs or os.cpu_count() or 1) * 4
+
+
+def restore(root, name, target, prefix="/"):
+    """
+    Restore files of snapshot {name} below {prefix} into {target} folder
+    Return number of entries that could not be restored
+    """
+
+    failures = 0
+    dirs = []
+
+    for entry in read_index(root, name):
+        if "p" not in entry or not entry["p"].startswith(prefix):
+            continue
+
+        path = os.path.join(target, entry["p"].lstrip("/"))
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            if entry["k"] == "d":
+                os.makedirs(path, exist_ok=True)
+                dirs.append((path, entry))
+                continue
+            elif entry["k"] == "l":
+                if os.path.lexists(path):
+                    os.remove(path)
+
+                os.symlink(entry["l"], path)
+            else:
+                with open(path, "wb") as f:
+                    for digest in entry["c"]:
+                        f.write(get_chunk(root, digest))
+
+                os.chmod(path, entry["m"])
+
+            restore_owner(path, entry)
+            os.utime(path, ns=(entry["t"], entry["t"]), follow_symlinks=False)
+        except (OSError, zlib.error):
+            failures += 1
+
+    # Folders get their mode and mtime once their content is written
+    for path, entry in reversed(dirs):
+        try:
+            os.chmod(path, entry["m"])
+            restore_owner(path, entry)
+            os.utime(path, ns=(entry["t"], entry["t"]))
+        except OSError:
+            failures += 1
+
+    return failures
+
+
+def restore_owner(path, entry):
+    """
+    Give back restored entry to its owner, when allowed to
+    """
+
+    if os.geteuid() == 0:
+        os.chown(path, entry["u"], entry["g"], follow_symlinks=False)
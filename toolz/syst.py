@@ -4,6 +4,10 @@ import os
 import re
 import socket
 
+from . import agent
+from . import aptlists
+from . import run
+from . import user
 from .base import yesno
 
 __description__ = "System functions module"
@@ -26,7 +30,7 @@ def reboot():
     """
 
     if yesno("Reboot now", "y"):
-        os.system("reboot")
+        run.run(["reboot"])
 
 
 def get_distro():
@@ -34,14 +38,41 @@ def get_distro():
     Return distro name based on '/etc/os-release' content
     """
 
-    distro = ""
+    return agent.ask("distro", compute_distro)
 
-    with open("/etc/os-release", "r") as f:
-        for line in f:
-            if line.startswith("ID="):
-                distro = line.split("=")[1].rstrip()
 
-    return distro
+def os_release():
+    """
+    Return '/etc/os-release' fields, parsed once and kept until it changes
+    """
+
+    try:
+        st = os.stat(os_release_file)
+    except OSError:
+        return {}
+
+    stamp = (st.st_mtime_ns, st.st_size)
+
+    if _os_release_cache["stamp"] != stamp:
+        fields = {}
+
+        with open(os_release_file, "r") as f:
+            for line in f:
+                if "=" in line and not line.startswith("#"):
+                    key, value = line.rstrip().split("=", 1)
+                    fields[key] = value.strip('"')
+
+        _os_release_cache.update({"stamp": stamp, "fields": fields})
+
+    return _os_release_cache["fields"]
+
+
+def compute_distro():
+    """
+    Read distro name from '/etc/os-release'
+    """
+
+    return os_release().get("ID", "")
 
 
 def get_codename():
@@ -49,24 +80,23 @@ def get_codename():
     Return codename based on '/etc/os-release' content
     """
 
-    codename = ""
+    return agent.ask("codename", compute_codename)
+
 
-    with open("/etc/os-release", "r") as f:
-        for line in f:
-            if line.startswith("VERSION_CODENAME="):
-                codename = line.split("=")[1].rstrip()
+def compute_codename():
+    """
+    Read codename from '/etc/os-release', telling sid from testing by the
+    suites apt lists come from
+    """
 
-    if get_distro() == "debian":
-        stable = "bullseye"
-        testing = "bookworm"
+    codename = os_release().get("VERSION_CODENAME", "")
 
-        if codename != stable:
-            test_sid = "apt search firefox 2>/dev/null | grep ^firefox/"
+    if compute_distro() == "debian":
+        codenames = [r.get("Codename") for r in aptlists.releases()
+                if r.get("Origin") == "Debian"]
 
-            if os.popen(test_sid).read() != "":
-                codename = "sid"
-            else:
-                codename = testing
+        if "sid" in codenames and codename not in codenames:
+            codename = "sid"
 
     return codename
 
@@ -99,10 +129,18 @@ def is_vm():
     Check if machine is virtual
     """
 
-    test_kvm = "lspci | grep -q paravirtual"
-    test_vbox = "lspci | grep -iq virtualbox"
+    return agent.ask("is_vm", compute_is_vm)
 
-    return os.system(test_kvm) == 0 or os.system(test_vbox) == 0
+
+def compute_is_vm():
+    """
+    Look for virtual devices in PCI devices list
+    """
+
+    pci_devices = run.output(["lspci"], timeout=10)
+
+    return "paravirtual" in pci_devices or \
+            "virtualbox" in pci_devices.lower()
 
 
 def is_valid_hostname(hostname):
@@ -183,7 +221,7 @@ def renew_hostname(fqdn):
             else:
                 newf.write(line)
 
-    os.system(f"hostname {hostname}")
+    run.run(["hostname", hostname])
 
 
 def list_users():
@@ -191,13 +229,8 @@ def list_users():
     List users having their home directory at '/home/{user}'
     """
 
-    users_list = []
-    potential_users = os.listdir("/home")
+    return user.get_list()
 
-    for user in potential_users:
-        with open("/etc/passwd") as f:
-            for line in f:
-                if line.startswith(f"{user}:"):
-                    users_list.append(user)
 
-    return users_list
+os_release_file = "/etc/os-release"
+_os_release_cache = {"stamp": None, "fields": {}}
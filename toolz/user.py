@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 
+import grp
 import os
+import pwd
 
+from . import agent
+from . import run
 from .base import yesno
 
 __description__ = "User management functions module"
@@ -24,6 +28,14 @@ def get_list():
     List users having their home directory at '/home/{user}'
     """
 
+    return agent.ask("users", compute_list)
+
+
+def compute_list():
+    """
+    Look for '/home' subfolders matching a user in '/etc/passwd'
+    """
+
     users_list = []
     potential_users = os.listdir("/home")
 
@@ -36,26 +48,38 @@ def get_list():
     return users_list
 
 
-def is_in_group(user, grp):
+def is_in_group(user, group):
+    """
+    Check if user '{user}' is in group '{group}'
+    """
+
+    return group in agent.ask("groups", compute_groups, user)
+
+
+def compute_groups(user):
     """
-    Check if user '{user}' is in group '{grp}'
+    List groups of user '{user}' from groups database, primary one included
     """
 
-    grp_list = os.popen(f"groups {user}").read()
+    try:
+        groups = [grp.getgrgid(pwd.getpwnam(user).pw_gid).gr_name]
+    except KeyError:
+        return []
 
-    if grp in grp_list:
-        return True
+    for group in grp.getgrall():
+        if user in group.gr_mem and group.gr_name not in groups:
+            groups.append(group.gr_name)
 
-    return False
+    return groups
 
 
-def add_to_group(user, grp):
+def add_to_group(user, group):
     """
-    Add '{user}' to group '{grp}'
+    Add '{user}' to group '{group}'
     """
 
-    if yesno(f"Add '{user}' to '{grp}'", "y"):
-        os.system(f"adduser {user} {grp}")
+    if yesno(f"Add '{user}' to '{group}'", "y"):
+        run.run(["adduser", user, group])
 
 
 def is_sudo():
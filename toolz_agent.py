@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+import toolz
+
+__description__ = "Keep system facts warm for toolz scripts"
+__author__ = "Choops <choopsbd@gmail.com>"
+
+c0 = "\33[0m"
+ce = "\33[31m"
+cok = "\33[32m"
+cw = "\33[33m"
+ci = "\33[36m"
+
+error = f"{ce}E{c0}:"
+done = f"{cok}OK{c0}:"
+warning = f"{cw}W{c0}:"
+
+
+def usage(err_code=0):
+    my_script = os.path.basename(__file__)
+    print(f"{ci}{__description__}\nUsage{c0}:")
+    print(f"  {my_script} [OPTION]")
+    print(f"  {ci}if no option{c0}: Run agent until [Ctrl]+[C]")
+    print(f"{ci}Options{c0}:")
+    print(f"  -h,--help:   Print this help")
+    print(f"  -s,--status: Check if agent is running\n")
+    exit(err_code)
+
+
+def agent_status():
+    sock = toolz.agent.socket_path()
+
+    try:
+        distro = toolz.agent.query("distro")
+    except (OSError, ValueError):
+        print(f"{warning} No agent listening on '{sock}'\n")
+        exit(1)
+
+    print(f"{done} Agent listening on '{sock}' ({distro})\n")
+
+
+def run_agent():
+    sock = toolz.agent.socket_path()
+
+    print(f"{ci}Agent listening on '{sock}'{c0}")
+    print(f"{cw}Press [Ctrl]+[C] to quit{c0}")
+
+    try:
+        toolz.agent.serve(sock)
+    except FileExistsError as exc:
+        print(f"{error} {exc}\n")
+        exit(1)
+    except KeyboardInterrupt:
+        print()
+
+
+if __name__ == "__main__":
+    if any(arg in sys.argv for arg in ["-h","--help"]):
+        usage()
+    elif len(sys.argv) == 2 and sys.argv[1] in ["-s", "--status"]:
+        agent_status()
+    elif len(sys.argv) > 1:
+        print(f"{error} Bad argument\n")
+        usage(1)
+    else:
+        run_agent()
@@ -36,16 +36,6 @@ def personalization(home):
     toolz.conf.vim(home)
     toolz.conf.xfce(home)
 
-    if home.startswith("/home/"):
-        user = home.split("/")[-1]
-
-        with open("/etc/passwd", "r") as f:
-            for line in f:
-                if line.startswith(f"{user}:"):
-                    group = line.split(":")[4]
-                    group = group.replace(",,,","")
-                    toolz.file.rchown(home, user, group)
-
 
 def install_xfce(distro, i386, req_pkgs, useless_pkgs):
     toolz.pkg.update_sourceslist(distro)
@@ -53,8 +43,9 @@ def install_xfce(distro, i386, req_pkgs, useless_pkgs):
     if i386:
         os.system("dpkg --add-architecture i386")
 
-    toolz.pkg.install(req_pkgs, True)
-    toolz.pkg.purge(useless_pkgs, True)
+    with toolz.pkg.transaction(force_yes=True):
+        toolz.pkg.install(req_pkgs, True)
+        toolz.pkg.purge(useless_pkgs, True)
 
     gtk_theme = "Mojave-gtk-theme"
     themesupdate.vinceliuice_theme(gtk_theme, "dark")
@@ -126,9 +117,9 @@ if __name__ == "__main__":
         usage(1)
 
     codename = toolz.syst.get_codename()
-    valid_codenames = ["bullseye", "bookworm", "sid"]
+    old_codenames = ["buster", "stretch", "jessie", "wheezy", "squeeze", "lenny"]
 
-    if codename not in valid_codenames:
+    if codename in old_codenames:
         print(f"{error} '{codename}' is a too old Debian version\n")
         exit(1)
 
@@ -157,7 +148,7 @@ if __name__ == "__main__":
 
     req_pkgs.append(ff_pkg)
 
-    if os.system("lspci | grep -qi nvidia") == 0:
+    if "nvidia" in toolz.run.output(["lspci"], timeout=10).lower():
         i386 = True
         req_pkgs += ["nvidia-driver", "nvidia-settings", "nvidia-xconfig"]
 